@@ -0,0 +1,69 @@
+# Đo bộ nhớ mỗi mục cache: response thô (dict JSON) so với record gọn sau khi parse
+# Chạy: python bench_cache_memory.py [số mục]
+import os
+import sys
+import json
+import tracemalloc
+
+os.environ.setdefault('SHARED_DB_PATH', ':memory:')
+
+import core
+
+DESCRIPTION = (
+    "<b>Tanjirou Kamado</b> sống cùng gia đình trên núi.<br><br>"
+    "Một ngày nọ, cậu trở về nhà và phát hiện cả gia đình bị quỷ tàn sát. "
+    "<i>(Source: Crunchyroll)</i><br><br>Note: Episode 1 had a 1-hour premiere. " * 6
+)
+
+def sample_media(i):
+    return {
+        "id": 100000 + i, "idMal": 38000 + i, "type": "ANIME",
+        "title": {"romaji": f"Kimetsu no Yaiba {i}", "english": f"Demon Slayer {i}", "native": "鬼滅の刃"},
+        "synonyms": ["KnY", "Demon Slayer"], "popularity": 900000,
+        "description": DESCRIPTION, "averageScore": 84, "status": "FINISHED",
+        "startDate": {"year": 2019, "month": 4, "day": 6}, "endDate": {"year": 2019, "month": 9, "day": 28},
+        "episodes": 26, "chapters": None,
+        "coverImage": {"large": f"https://s4.anilist.co/file/anilistcdn/media/anime/cover/large/bx{i}.jpg"},
+        "siteUrl": f"https://anilist.co/anime/{100000 + i}"
+    }
+
+def sample_character(i):
+    return {
+        "id": 200000 + i, "name": {"full": f"Nezuko Kamado {i}"}, "description": DESCRIPTION,
+        "media": {"nodes": [{"id": 1, "type": "ANIME", "title": {"romaji": "Kimetsu no Yaiba"}}]},
+        "image": {"large": f"https://s4.anilist.co/file/anilistcdn/character/large/b{i}.png"}
+    }
+
+# Mỗi loại: (tên, hàm tạo phần 'data' của response, hàm parse giống AniListClient)
+CASES = [
+    ("Media (search)", lambda i: {"Media": sample_media(i)}, lambda data: core.parse_media(data.get('Media'))),
+    ("Page 10 media (trending)", lambda i: {"Page": {"media": [sample_media(i * 10 + j) for j in range(10)]}},
+     core.page_items('media', core.parse_media)),
+    ("Page 50 nhân vật (top)", lambda i: {"Page": {"characters": [sample_character(i * 50 + j) for j in range(50)]}},
+     core.page_items('characters', core.parse_character)),
+]
+
+def measure(entries, build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    store = {}
+    for i, payload in enumerate(entries):
+        store[i] = build(payload)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return total / len(entries), store
+
+def run(count):
+    print(f"{'Loại':<28}{'Thô (byte/mục)':>18}{'Record (byte/mục)':>20}{'Giảm':>8}")
+    for name, make_data, parse in CASES:
+        # Chuỗi JSON như nhận từ mạng; mỗi lần json.loads tạo object mới giống resp.json()
+        payloads = [json.dumps({"data": make_data(i)}) for i in range(count)]
+        raw_size, _ = measure(payloads, json.loads)
+        record_size, _ = measure(payloads, lambda payload: parse(json.loads(payload)['data']))
+        print(f"{name:<28}{raw_size:>18,.0f}{record_size:>20,.0f}{1 - record_size / raw_size:>8.0%}")
+
+if __name__ == "__main__":
+    # is_female_character in log cho từng nhân vật; tắt đi khi đo
+    core.print = lambda *args, **kwargs: None
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
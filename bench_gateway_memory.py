@@ -0,0 +1,155 @@
+# Đo RSS của gateway khi nạp nhiều server giả lập: hồ sơ mặc định so với LOW_MEMORY
+# Mỗi hồ sơ chạy trong process riêng vì LOW_MEMORY được đọc lúc import core/gateway.
+# Payload GUILD_CREATE/MESSAGE_CREATE được dựng theo intents của hồ sơ (Discord không gửi voice state,
+# sự kiện lịch, typing... khi intent tương ứng tắt) rồi đưa thẳng vào ConnectionState của discord.py.
+# Chạy: python bench_gateway_memory.py [--guilds 2000] [--messages 20000] [--max-rss MB]
+import os
+import sys
+import gc
+import json
+import subprocess
+
+DEFAULT_GUILDS = 2000
+DEFAULT_MESSAGES = 20000
+CHANNELS_PER_GUILD = 15
+ROLES_PER_GUILD = 10
+EMOJIS_PER_GUILD = 20
+MEMBERS_PER_GUILD = 30  # thành viên có trong GUILD_CREATE (đang ở kênh thoại, chủ server...)
+EVENTS_PER_GUILD = 2
+BOT_ID = 1
+
+def get_arg_value(name, default):
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+def read_rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def user_payload(user_id):
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "global_name": f"User {user_id}",
+            "avatar": "a" * 32}
+
+def member_payload(user_id, role_ids):
+    return {"user": user_payload(user_id), "roles": role_ids[:2], "joined_at": "2024-01-01T00:00:00+00:00",
+            "deaf": False, "mute": False, "flags": 0}
+
+def guild_payload(guild_id, intents):
+    base = guild_id * 1000
+    channel_ids = [str(base + i) for i in range(CHANNELS_PER_GUILD)]
+    role_ids = [str(base + 100 + i) for i in range(ROLES_PER_GUILD)]
+    member_ids = [BOT_ID] + [base + 200 + i for i in range(MEMBERS_PER_GUILD)]
+    data = {
+        "id": str(guild_id), "name": f"Server {guild_id}", "owner_id": str(member_ids[1]),
+        "member_count": 5000, "large": True, "features": [], "preferred_locale": "vi",
+        "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "104324673", "position": 0,
+                   "color": 0, "hoist": False, "managed": False, "mentionable": False}] +
+                 [{"id": role_id, "name": f"role {role_id}", "permissions": "0", "position": i + 1, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False} for i, role_id in enumerate(role_ids)],
+        "channels": [{"id": channel_id, "type": 0 if i < CHANNELS_PER_GUILD - 3 else 2, "name": f"kenh-{i}",
+                      "position": i, "permission_overwrites": [], "topic": "Kênh chat " * 5,
+                      "bitrate": 64000, "user_limit": 0}
+                     for i, channel_id in enumerate(channel_ids)],
+        "emojis": [{"id": str(base + 500 + i), "name": f"emoji{i}", "roles": [], "require_colons": True,
+                    "managed": False, "animated": False, "available": True} for i in range(EMOJIS_PER_GUILD)],
+        "stickers": [],
+        "members": [member_payload(member_id, role_ids) for member_id in member_ids],
+        "threads": [],
+    }
+    if intents.voice_states:
+        voice_channel = channel_ids[-1]
+        data["voice_states"] = [{"user_id": str(member_id), "channel_id": voice_channel, "session_id": "s",
+                                 "deaf": False, "mute": False, "self_deaf": False, "self_mute": False,
+                                 "self_video": False, "suppress": False} for member_id in member_ids[1:11]]
+    if intents.guild_scheduled_events:
+        data["guild_scheduled_events"] = [{"id": str(base + 700 + i), "guild_id": str(guild_id),
+                                           "name": f"Xem anime {i}", "description": "Cùng xem tập mới " * 5,
+                                           "scheduled_start_time": "2026-01-01T00:00:00+00:00",
+                                           "privacy_level": 2, "status": 1, "entity_type": 3,
+                                           "entity_metadata": {"location": "Online"}} for i in range(EVENTS_PER_GUILD)]
+    return data
+
+def message_payload(message_id, guild_id, role_ids):
+    base = guild_id * 1000
+    author_id = base + 200 + message_id % MEMBERS_PER_GUILD
+    return {"id": str(message_id), "channel_id": str(base + message_id % (CHANNELS_PER_GUILD - 3)),
+            "guild_id": str(guild_id), "author": user_payload(author_id),
+            "member": {"roles": role_ids[:2], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False},
+            "content": "Hôm nay có anime gì mới không mọi người? " * 3, "timestamp": "2026-01-01T00:00:00+00:00",
+            "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [],
+            "attachments": [], "embeds": [], "pinned": False, "type": 0}
+
+def run_profile(guild_count, message_count):
+    os.environ.setdefault('DISCORD_TOKEN', 'bench')
+    os.environ.setdefault('CHANNEL_ID', '0')
+    os.environ.setdefault('SHARED_DB_PATH', ':memory:')
+    import gateway
+
+    gc.collect()
+    baseline = read_rss_mb()
+    state = gateway.bot._connection
+    state.dispatch = lambda *args, **kwargs: None  # chỉ đo cache, không chạy event handler
+    for guild_id in range(1, guild_count + 1):
+        state._add_guild_from_data(guild_payload(guild_id, gateway.intents))
+    # Tin nhắn trong các kênh chat; cache tin nhắn mặc định của discord.py giữ 1000 tin gần nhất
+    for message_id in range(message_count):
+        guild_id = message_id % guild_count + 1
+        role_ids = [str(guild_id * 1000 + 100 + i) for i in range(ROLES_PER_GUILD)]
+        state.parse_message_create(message_payload(message_id, guild_id, role_ids))
+    # Cache của bot: ghi gấp 10 lần giới hạn để chắc chắn chúng không phình ra
+    media = gateway.Media(id=1, type="ANIME", title="Kimetsu no Yaiba", description="Mô tả " * 40,
+                          cover="https://example.com/c.jpg", url="https://anilist.co/anime/1")
+    for i in range(gateway.cache.maxsize * 10):
+        gateway.cache[f"bench-{i}"] = [media] * 10
+    for i in range(gateway.embed_cache.maxsize * 10):
+        media.id = i + 1
+        gateway.create_embed(media, 'anime')
+    gc.collect()
+    members = sum(len(guild._members) for guild in state._guilds.values())
+    return {
+        "profile": "low" if gateway.LOW_MEMORY else "default",
+        "rss_mb": read_rss_mb(),
+        "growth_mb": read_rss_mb() - baseline,
+        "guilds": len(state._guilds),
+        "members": members,
+        "messages": len(state._messages) if state._messages is not None else 0,
+        "emojis": len(state._emojis),
+        "cache": len(gateway.cache),
+        "embed_cache": len(gateway.embed_cache),
+    }
+
+def run(guild_count, message_count, max_rss):
+    results = []
+    for low_memory in ('false', 'true'):
+        env = dict(os.environ, LOW_MEMORY=low_memory)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--profile', '--guilds', str(guild_count), '--messages', str(message_count)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(f"{guild_count} server, {message_count} tin nhắn")
+    print(f"{'Hồ sơ':<10}{'RSS (MB)':>10}{'Tăng (MB)':>11}{'Thành viên':>12}{'Tin nhắn':>10}{'Emoji':>8}{'Cache':>8}{'Embed':>8}")
+    for r in results:
+        print(f"{r['profile']:<10}{r['rss_mb']:>10.1f}{r['growth_mb']:>11.1f}{r['members']:>12}{r['messages']:>10}"
+              f"{r['emojis']:>8}{r['cache']:>8}{r['embed_cache']:>8}")
+    low = results[-1]
+    if max_rss and low['rss_mb'] > max_rss:
+        print(f"❌ RSS hồ sơ low ({low['rss_mb']:.1f} MB) vượt ngưỡng {max_rss} MB")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    guild_count = int(get_arg_value("--guilds", str(DEFAULT_GUILDS)))
+    message_count = int(get_arg_value("--messages", str(DEFAULT_MESSAGES)))
+    if "--profile" in sys.argv:
+        print(json.dumps(run_profile(guild_count, message_count)))
+    else:
+        max_rss = get_arg_value("--max-rss", None)
+        sys.exit(run(guild_count, message_count, float(max_rss) if max_rss else None))
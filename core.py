@@ -0,0 +1,1669 @@
+# Phần lõi không cần discord.py: cấu hình, store dùng chung, client API và các hàm tính feed.
+# Worker và --seed-catalog chỉ import module này; gateway.py dựng bot trên nền nó.
+import time
+STARTUP_STARTED = time.perf_counter()  # Mốc đo thời gian khởi động
+
+import os
+import aiohttp
+from dotenv import load_dotenv
+import datetime
+import asyncio
+import sqlite3
+from cachetools import TTLCache
+import json
+import math
+import hashlib
+import re
+import html
+import difflib
+import unicodedata
+from dataclasses import dataclass
+
+# Tải biến môi trường từ .env
+load_dotenv()
+
+# Cấu hình
+ANILIST_API = "https://graphql.anilist.co"
+JIKAN_API = "https://api.jikan.moe/v4"
+WAIFU_IM_API = "https://api.waifu.im"
+CHECK_INTERVAL = 3600
+CACHE_TTL = 3600
+# Hồ sơ ít bộ nhớ: thu hẹp intents, tắt cache tin nhắn/thành viên của discord.py và thu nhỏ cache của bot
+LOW_MEMORY = os.getenv('LOW_MEMORY', 'false').lower() in ('1', 'true')
+CACHE_MAX_SIZE = int(os.getenv('CACHE_MAX_SIZE', '50' if LOW_MEMORY else '100'))  # Response API trong bộ nhớ
+SHARED_DB_PATH = os.getenv('SHARED_DB_PATH', 'shared.db')  # Cache + rate limit dùng chung giữa các process
+# Store dùng chung chạy đồng bộ trên event loop: gateway chỉ chờ khóa ghi rất ngắn để không chặn heartbeat,
+# worker/seed không giữ kết nối Discord nên được chờ lâu hơn
+SHARED_DB_BUSY_TIMEOUT = 0.05  # giây
+SHARED_DB_WORKER_BUSY_TIMEOUT = 10  # giây
+SHARED_DB_RETRY_DELAY = 0.05  # giây, chờ (bất đồng bộ) rồi thử lấy token rate limit lại khi DB đang bị khóa
+# Khoảng quét tự điều chỉnh theo tần suất feed thay đổi: {feed: (tối thiểu, tối đa)} giây
+POLL_BOUNDS = {
+    "seasons": (CHECK_INTERVAL, CHECK_INTERVAL * 6),
+    "ranking": (CHECK_INTERVAL // 2, CHECK_INTERVAL * 4),
+    "new_anime": (CHECK_INTERVAL // 4, CHECK_INTERVAL * 2),
+    "new_waifu": (CHECK_INTERVAL // 4, CHECK_INTERVAL * 2),
+    "airing": (CHECK_INTERVAL, CHECK_INTERVAL * 3),
+}
+POLL_TIGHTEN = 0.5  # Feed vừa thay đổi: rút ngắn khoảng quét
+POLL_RELAX = 1.5  # Feed đứng yên: giãn khoảng quét
+WORKER_TICK = 60  # giây, worker kiểm tra feed nào đến hạn quét
+VALIDATOR_TTL = CACHE_TTL * 24  # ETag/Last-Modified/hash không dùng lại sau mức này sẽ bị dọn
+WORKER_STALE_AFTER = WORKER_TICK * 5  # giây, heartbeat của worker cũ hơn mức này coi như worker không chạy
+JIKAN_SEASONS = ("now", "upcoming")
+JIKAN_SEASON_MAX_PAGES = 20  # 25 anime/trang
+RELEASE_FETCH_DEADLINE = 15  # giây, thời hạn chung khi hỏi nhiều nguồn song song
+CATALOG_DETAIL_TTL = int(os.getenv('CATALOG_DETAIL_TTL', str(CACHE_TTL * 24)))  # Chi tiết trong catalog cũ hơn mức này sẽ tải lại theo id
+CATALOG_MIN_SCORE = 0.9  # Độ khớp tối thiểu để tin kết quả tìm kiếm cục bộ (trùng hoặc gần trùng tên)
+CACHE_SCHEMA = 2  # Tăng khi định dạng record trong cache/feed thay đổi
+DESCRIPTION_LIMIT = 200  # Mô tả được làm sạch HTML và cắt ngắn một lần lúc parse
+TOP_WAIFU_MAX_PAGES = 4  # 50 nhân vật/trang khi lọc top waifu
+
+# Giới hạn request dùng chung cho mọi shard: {api: (số request, trong bao nhiêu giây)}
+RATE_LIMITS = {
+    "anilist": (30, 60),
+    "jikan": (3, 1),
+    "waifu_im": (10, 1),
+}
+
+# Danh sách thể loại hợp lệ
+GENRE_LIST = [
+    "action", "adventure", "comedy", "drama", "fantasy", "horror", "mystery", "romance",
+    "sci-fi", "slice of life", "sports", "supernatural", "ecchi", "historical", "isekai",
+    "mecha", "music", "psychological", "school", "shounen", "shoujo", "seinen", "josei"
+]
+
+# Danh sách tên và từ khóa để xác định nhân vật nữ
+FEMALE_NAME_PATTERNS = [
+    "sakura", "hinata", "yuki", "miku", "asuka", "rei", "misaki", "haruka", "ayaka", "chika",
+    "chan", "san", "ko", "ka", "mi", "na", "rin", "sama", "tsuki", "hana", "yuna", "aoi",
+    "emilia", "rem", "ram", "mikasa", "nobara", "maki", "mai", "yor", "anya", "kaguya",
+    "shoko", "marin", "nezuko", "saber", "violet", "erza", "lucy", "nami", "robin"
+]
+FEMALE_KEYWORDS = [
+    "she", "her", "girl", "female", "woman", "lady", "princess", "queen", "sister", "daughter",
+    "wife", "mother", "girlfriend", "heroine", "maid", "idol", "magical girl"
+]
+MALE_KEYWORDS = [
+    "he", "his", "boy", "male", "man", "gentleman", "king", "prince", "brother", "son",
+    "husband", "father", "boyfriend", "hero", "warrior", "knight", "soldier", "ninja",
+    "samurai", "pirate", "captain", "commander", "leader"
+]
+
+
+# Đọc danh sách shard dạng "0-3" hoặc "0,2,4"
+def parse_shard_ids(spec):
+    if not spec:
+        return None
+    shard_ids = []
+    for part in spec.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-', 1)
+            shard_ids.extend(range(int(start), int(end) + 1))
+        elif part:
+            shard_ids.append(int(part))
+    return shard_ids
+
+
+# Cấu hình shard (cluster launcher sẽ tự đặt các biến này cho từng process)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0'))
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS'))
+CLUSTER_ID = int(os.getenv('CLUSTER_ID', '0'))
+SHARDED = SHARD_COUNT > 0 or os.getenv('SHARDED', '').lower() in ('1', 'true')
+
+if SHARD_IDS and not SHARD_COUNT:
+    raise ValueError("SHARD_IDS cần đi kèm SHARD_COUNT")
+
+# Cache API
+cache = TTLCache(maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL)
+
+# Khởi tạo database
+def init_db():
+    conn = sqlite3.connect('waifu.db')
+    conn.execute('CREATE TABLE IF NOT EXISTS votes (user_id TEXT, waifu TEXT)')
+    conn.execute('CREATE TABLE IF NOT EXISTS rankings (genre TEXT, data TEXT)')  # Lưu bảng xếp hạng
+    conn.execute('CREATE TABLE IF NOT EXISTS subscriptions (kind TEXT, channel_id INTEGER, genre TEXT, PRIMARY KEY (kind, channel_id))')
+    conn.execute('CREATE TABLE IF NOT EXISTS announced (kind TEXT, item_key TEXT, cluster_id INTEGER, announced_at REAL, PRIMARY KEY (kind, item_key, cluster_id))')
+    conn.commit()
+    conn.close()
+
+# Lọc bỏ những mục đã thông báo (mỗi cluster ghi nhận riêng vì mỗi cluster giữ các kênh khác nhau)
+# keys_func trả về mọi định danh của một mục; trùng bất kỳ định danh nào là coi như đã thông báo
+def filter_unannounced(kind, items, keys_func):
+    conn = sqlite3.connect('waifu.db')
+    announced = {row[0] for row in conn.execute('SELECT item_key FROM announced WHERE kind = ? AND cluster_id = ?', (kind, CLUSTER_ID))}
+    conn.close()
+    fresh = [item for item in items if announced.isdisjoint(keys_func(item))]
+    print(f"{kind}: bỏ qua {len(items) - len(fresh)} mục đã thông báo, còn {len(fresh)} mục mới")
+    return fresh
+
+def mark_announced(kind, items, keys_func):
+    now = time.time()
+    conn = sqlite3.connect('waifu.db')
+    conn.executemany('INSERT OR REPLACE INTO announced (kind, item_key, cluster_id, announced_at) VALUES (?, ?, ?, ?)',
+                     [(kind, key, CLUSTER_ID, now) for item in items for key in keys_func(item)])
+    conn.execute('DELETE FROM announced WHERE announced_at < ?', (now - 7 * 86400,))
+    conn.commit()
+    conn.close()
+
+# Mọi định danh của một anime mới (id AniList, MAL id, tên đã chuẩn hóa): mục báo từ Jikan lúc AniList lỗi
+# vẫn được nhận ra khi AniList trả lời lại và mục gộp mang id khác
+def release_keys(release):
+    keys = []
+    if release.get('id'):
+        keys.append(f"anilist:{release['id']}")
+    if release.get('mal_id'):
+        keys.append(f"mal:{release['mal_id']}")
+    for title in [release['title']] + release.get('titles', []):
+        key = f"title:{normalize_title(title)}" if title else None
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+def character_keys(character):
+    return [f"character:{character.id}"]
+
+def save_subscription(kind, channel_id, genre=None):
+    conn = sqlite3.connect('waifu.db')
+    conn.execute('INSERT OR REPLACE INTO subscriptions (kind, channel_id, genre) VALUES (?, ?, ?)', (kind, channel_id, genre))
+    conn.commit()
+    conn.close()
+
+def remove_subscription(kind, channel_id):
+    conn = sqlite3.connect('waifu.db')
+    conn.execute('DELETE FROM subscriptions WHERE kind = ? AND channel_id = ?', (kind, channel_id))
+    conn.commit()
+    conn.close()
+
+# Ghi lại thời gian từng bước khởi động
+startup_timeline = []
+
+def mark_phase(name, started):
+    duration = time.perf_counter() - started
+    startup_timeline.append((name, duration))
+    print(f"[startup] {name}: {duration * 1000:.0f}ms")
+    return time.perf_counter()
+
+# Lớp SharedStore: cache response + rate limit dùng chung giữa các process (SQLite WAL)
+class SharedStore:
+    def __init__(self, path, busy_timeout=SHARED_DB_BUSY_TIMEOUT):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.conn = None
+
+    def get_conn(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS http_cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS rate_limits (api TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS shard_health (
+                shard_id INTEGER PRIMARY KEY, cluster_id INTEGER, pid INTEGER,
+                latency REAL, guilds INTEGER, closed INTEGER, updated REAL)''')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS feeds (name TEXT PRIMARY KEY, data TEXT, updated REAL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS watermarks (name TEXT PRIMARY KEY, day TEXT, value INTEGER)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS heartbeats (name TEXT PRIMARY KEY, updated REAL)')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS http_validators (
+                key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, value TEXT, updated REAL)''')
+        return self.conn
+
+    @staticmethod
+    def make_key(raw_key):
+        return hashlib.sha1(raw_key.encode('utf-8')).hexdigest()
+
+    def cache_get(self, key):
+        try:
+            row = self.get_conn().execute(
+                'SELECT value FROM http_cache WHERE key = ? AND expires > ?',
+                (key, time.time())
+            ).fetchone()
+            return decode_records(json.loads(row[0])) if row else None
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (cache_get): {e}")
+            return None
+
+    def cache_set(self, key, value, ttl=CACHE_TTL):
+        try:
+            self.get_conn().execute(
+                'INSERT OR REPLACE INTO http_cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, json.dumps(encode_records(value)), time.time() + ttl)
+            )
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (cache_set): {e}")
+
+    # Đọc các response còn hạn để làm nóng cache lúc khởi động (dùng connection riêng vì chạy trong thread)
+    def load_cache_rows(self, limit, min_ttl=0):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            rows = conn.execute(
+                'SELECT key, value FROM http_cache WHERE expires > ? ORDER BY expires DESC LIMIT ?',
+                (time.time() + min_ttl, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (load_cache_rows): {e}")
+            rows = []
+        finally:
+            conn.close()
+        return [(key, decode_records(json.loads(value))) for key, value in rows]
+
+    # Validator của lần tải trước: ETag/Last-Modified cho request có điều kiện, hash nội dung khi API không hỗ trợ
+    def get_validator(self, key):
+        try:
+            row = self.get_conn().execute(
+                'SELECT etag, last_modified, content_hash, value FROM http_validators WHERE key = ?', (key,)
+            ).fetchone()
+            if not row:
+                return None
+            etag, last_modified, content_hash, value = row
+            return {"etag": etag, "last_modified": last_modified, "content_hash": content_hash,
+                    "value": decode_records(json.loads(value))}
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (get_validator): {e}")
+            return None
+
+    def set_validator(self, key, value, etag=None, last_modified=None, content_hash=None):
+        try:
+            self.get_conn().execute(
+                'INSERT OR REPLACE INTO http_validators (key, etag, last_modified, content_hash, value, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, etag, last_modified, content_hash, json.dumps(encode_records(value)), time.time())
+            )
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (set_validator): {e}")
+
+    def get_content_hash(self, key):
+        try:
+            row = self.get_conn().execute('SELECT content_hash FROM http_validators WHERE key = ?', (key,)).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (get_content_hash): {e}")
+            return None
+
+    def touch_validator(self, key):
+        try:
+            self.get_conn().execute('UPDATE http_validators SET updated = ? WHERE key = ?', (time.time(), key))
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (touch_validator): {e}")
+
+    def purge_expired(self):
+        try:
+            self.get_conn().execute('DELETE FROM http_cache WHERE expires <= ?', (time.time(),))
+            self.get_conn().execute('DELETE FROM http_validators WHERE updated <= ?', (time.time() - VALIDATOR_TTL,))
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (purge_expired): {e}")
+
+    # Token bucket: trả về số giây cần chờ (0 nếu đã lấy được token, None nếu process khác đang giữ khóa ghi)
+    def take_token(self, api, capacity, rate):
+        conn = self.get_conn()
+        now = time.time()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated FROM rate_limits WHERE api = ?', (api,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute('INSERT OR REPLACE INTO rate_limits (api, tokens, updated) VALUES (?, ?, ?)', (api, tokens, now))
+            conn.execute('COMMIT')
+            return wait
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            if isinstance(e, sqlite3.OperationalError) and 'locked' in str(e):
+                return None
+            print(f"Lỗi SharedStore (rate limit {api}): {e}")
+            return 0
+
+    async def acquire(self, api):
+        capacity, per = RATE_LIMITS[api]
+        while True:
+            wait = self.take_token(api, capacity, capacity / per)
+            if wait is None:
+                # DB đang bị khóa: nhường event loop rồi thử lại thay vì chặn trong busy timeout của SQLite
+                await asyncio.sleep(SHARED_DB_RETRY_DELAY)
+                continue
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    # Feed được worker tính sẵn (bảng xếp hạng, anime mới, lịch chiếu...)
+    # Trả về True nếu nội dung khác lần ghi trước; nội dung giống hệt thì chỉ cập nhật thời điểm
+    def set_feed(self, name, data):
+        encoded = json.dumps(encode_records(data))
+        conn = self.get_conn()
+        try:
+            unchanged = conn.execute(
+                'UPDATE feeds SET updated = ? WHERE name = ? AND data = ?', (time.time(), name, encoded)
+            ).rowcount
+            if unchanged:
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO feeds (name, data, updated) VALUES (?, ?, ?)',
+                (name, encoded, time.time())
+            )
+            return True
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (set_feed {name}): {e}")
+            return False
+
+    def get_feed(self, name, max_age):
+        try:
+            row = self.get_conn().execute(
+                'SELECT data FROM feeds WHERE name = ? AND updated > ?',
+                (name, time.time() - max_age)
+            ).fetchone()
+            return decode_records(json.loads(row[0])) if row else None
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (get_feed {name}): {e}")
+            return None
+
+    # High-watermark theo ngày: sang ngày mới thì bắt đầu lại từ 0
+    def get_watermark(self, name, day):
+        try:
+            row = self.get_conn().execute('SELECT day, value FROM watermarks WHERE name = ?', (name,)).fetchone()
+            return row[1] if row and row[0] == day else 0
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (get_watermark {name}): {e}")
+            return 0
+
+    # Có `feed` thì ghi feed các mục đã xử lý cùng watermark trong một transaction: watermark chỉ tiến khi feed
+    # đã được lưu, nếu không lần quét sau sẽ bỏ qua những mục chưa kịp ghi
+    def set_watermark(self, name, day, value, feed=None, data=None):
+        conn = self.get_conn()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if feed is not None:
+                conn.execute('INSERT OR REPLACE INTO feeds (name, data, updated) VALUES (?, ?, ?)',
+                             (feed, json.dumps(encode_records(data)), time.time()))
+            conn.execute('INSERT OR REPLACE INTO watermarks (name, day, value) VALUES (?, ?, ?)', (name, day, value))
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            print(f"Lỗi SharedStore (set_watermark {name}): {e}")
+
+    # Heartbeat của process nền (worker): gateway dựa vào đây để biết có cần tự tính feed hay không
+    def beat(self, name):
+        try:
+            self.get_conn().execute('INSERT OR REPLACE INTO heartbeats (name, updated) VALUES (?, ?)', (name, time.time()))
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (beat {name}): {e}")
+
+    def last_beat(self, name):
+        try:
+            row = self.get_conn().execute('SELECT updated FROM heartbeats WHERE name = ?', (name,)).fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (last_beat {name}): {e}")
+            return 0
+
+    def report_shard(self, shard_id, latency, guilds, closed):
+        try:
+            self.get_conn().execute(
+                'INSERT OR REPLACE INTO shard_health (shard_id, cluster_id, pid, latency, guilds, closed, updated) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (shard_id, CLUSTER_ID, os.getpid(), latency, guilds, int(closed), time.time())
+            )
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (report_shard): {e}")
+
+    def get_shard_health(self):
+        try:
+            return self.get_conn().execute(
+                'SELECT shard_id, cluster_id, pid, latency, guilds, closed, updated FROM shard_health ORDER BY shard_id'
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Lỗi SharedStore (get_shard_health): {e}")
+            return []
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+shared_store = SharedStore(SHARED_DB_PATH)
+
+def normalize_title(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+
+# Các record gọn thay cho dict response thô: chỉ giữ những trường bot dùng
+def clean_description(text, limit=DESCRIPTION_LIMIT):
+    if not text:
+        return None
+    text = re.sub(r'<br\s*/?>', ' ', text, flags=re.IGNORECASE)
+    text = html.unescape(re.sub(r'<[^>]+>', '', text))
+    text = ' '.join(text.split())
+    return text[:limit] + '...' if len(text) > limit else text
+
+def parse_date(date):
+    if not date or not date.get('year'):
+        return None
+    return (date['year'], date.get('month'), date.get('day'))
+
+@dataclass(slots=True)
+class Media:
+    id: int = None
+    mal_id: int = None
+    type: str = None
+    title: str = None
+    title_english: str = None
+    description: str = None
+    score: int = None
+    status: str = None
+    start_date: tuple = None
+    end_date: tuple = None
+    episodes: int = None
+    chapters: int = None
+    cover: str = None
+    url: str = None
+
+@dataclass(slots=True)
+class Character:
+    id: int = None
+    name: str = None
+    description: str = None
+    image: str = None
+    url: str = None
+    anime: str = None
+    female: bool = False
+
+@dataclass(slots=True)
+class AiringSlot:
+    airing_at: int = None
+    episode: int = None
+    media: Media = None
+
+@dataclass(slots=True)
+class WaifuImage:
+    image_id: int = None
+    url: str = None
+    is_nsfw: bool = False
+
+RECORD_TYPES = {cls.__name__: cls for cls in (Media, Character, AiringSlot, WaifuImage)}
+
+def parse_media(raw):
+    if not raw:
+        return None
+    title = raw.get('title') or {}
+    return Media(
+        id=raw.get('id'),
+        mal_id=raw.get('idMal'),
+        type=raw.get('type'),
+        title=title.get('romaji') or title.get('english'),
+        title_english=title.get('english'),
+        description=clean_description(raw.get('description')),
+        score=raw.get('averageScore'),
+        status=raw.get('status'),
+        start_date=parse_date(raw.get('startDate')),
+        end_date=parse_date(raw.get('endDate')),
+        episodes=raw.get('episodes'),
+        chapters=raw.get('chapters'),
+        cover=(raw.get('coverImage') or {}).get('large'),
+        url=raw.get('siteUrl')
+    )
+
+def parse_character(raw):
+    if not raw:
+        return None
+    nodes = (raw.get('media') or {}).get('nodes') or []
+    return Character(
+        id=raw.get('id'),
+        name=raw['name']['full'],
+        description=clean_description(raw.get('description')),
+        image=(raw.get('image') or {}).get('large'),
+        url=raw.get('siteUrl'),
+        anime=nodes[0]['title']['romaji'] if nodes else None,
+        # Phân loại trên mô tả đầy đủ trước khi cắt ngắn
+        female=is_female_character(raw)
+    )
+
+def parse_airing_slot(raw):
+    return AiringSlot(airing_at=raw['airingAt'], episode=raw.get('episode'), media=parse_media(raw.get('media')))
+
+def parse_waifu_image(raw):
+    return WaifuImage(image_id=raw.get('image_id'), url=raw['url'], is_nsfw=bool(raw.get('is_nsfw')))
+
+def parse_jikan_anime(raw):
+    aired = (raw.get('aired') or {}).get('from')
+    return Media(
+        mal_id=raw['mal_id'],
+        type="ANIME",
+        title=raw['title'],
+        title_english=raw.get('title_english'),
+        description=clean_description(raw.get('synopsis')),
+        score=round(raw['score'] * 10) if raw.get('score') else None,
+        status=raw.get('status'),
+        start_date=tuple(int(part) for part in aired[:10].split('-')) if aired else None,
+        episodes=raw.get('episodes'),
+        cover=((raw.get('images') or {}).get('jpg') or {}).get('large_image_url'),
+        url=raw['url']
+    )
+
+def page_items(key, parser):
+    return lambda data: [parser(item) for item in (data.get('Page') or {}).get(key) or []]
+
+# Như page_items nhưng giữ lại pageInfo.hasNextPage để duyệt tiếp trang sau
+def page_with_info(key, parser):
+    def parse(data):
+        page = data.get('Page') or {}
+        return {"items": [parser(item) for item in page.get(key) or []],
+                "has_next": bool((page.get('pageInfo') or {}).get('hasNextPage'))}
+    return parse
+
+# Mã hóa record sang JSON (để lưu vào store dùng chung) và ngược lại
+def encode_records(value):
+    if isinstance(value, (list, tuple)):
+        return [encode_records(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_records(item) for key, item in value.items()}
+    if type(value).__name__ in RECORD_TYPES:
+        encoded = {slot: encode_records(getattr(value, slot)) for slot in value.__slots__}
+        encoded['__record__'] = type(value).__name__
+        return encoded
+    return value
+
+def decode_records(value):
+    if isinstance(value, list):
+        return [decode_records(item) for item in value]
+    if isinstance(value, dict):
+        if '__record__' in value:
+            record_type = RECORD_TYPES[value['__record__']]
+            decoded = {key: decode_records(item) for key, item in value.items() if key != '__record__'}
+            for key in ('start_date', 'end_date'):
+                if decoded.get(key) is not None:
+                    decoded[key] = tuple(decoded[key])
+            return record_type(**decoded)
+        return {key: decode_records(item) for key, item in value.items()}
+    return value
+
+# Lớp Catalog: chỉ mục tên anime/manga/nhân vật (FTS5 trigram) để tìm gần đúng mà không cần gọi AniList
+class Catalog:
+    KIND_CODES = {"ANIME": 1, "MANGA": 2, "CHARACTER": 3}
+
+    def __init__(self, store):
+        self.store = store
+        self.ready = None
+
+    def get_conn(self):
+        conn = self.store.get_conn()
+        if self.ready is None:
+            try:
+                conn.execute('''CREATE TABLE IF NOT EXISTS catalog (
+                    kind TEXT, id INTEGER, names TEXT, popularity INTEGER,
+                    detail TEXT, detail_updated REAL, PRIMARY KEY (kind, id))''')
+                conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts
+                    USING fts5(names, kind UNINDEXED, popularity UNINDEXED, tokenize='trigram')''')
+                self.ready = True
+            except sqlite3.Error as e:
+                print(f"Catalog bị tắt (SQLite không hỗ trợ FTS5 trigram): {e}")
+                self.ready = False
+        return conn if self.ready else None
+
+    def make_rowid(self, kind, record_id):
+        return self.KIND_CODES[kind] * 1_000_000_000 + record_id
+
+    # Tên mới được gộp vào danh sách đã lưu: response chỉ có romaji không xóa tên english/native/synonyms/alias cũ
+    def upsert(self, kind, record_id, names, popularity=None):
+        conn = self.get_conn()
+        names = [normalize_title(name) for name in names if name]
+        names = [name for name in names if name]
+        if conn is None or not names or kind not in self.KIND_CODES:
+            return
+        rowid = self.make_rowid(kind, record_id)
+        try:
+            row = conn.execute('SELECT names, popularity FROM catalog WHERE kind = ? AND id = ?', (kind, record_id)).fetchone()
+            stored = row[0].split('\n') if row and row[0] else []
+            joined = '\n'.join(dict.fromkeys(stored + names))
+            if row and row[0] == joined and (popularity is None or row[1] == popularity):
+                return
+            if row:
+                popularity = popularity if popularity is not None else row[1]
+                conn.execute('UPDATE catalog SET names = ?, popularity = ? WHERE kind = ? AND id = ?', (joined, popularity, kind, record_id))
+            else:
+                conn.execute('INSERT INTO catalog (kind, id, names, popularity) VALUES (?, ?, ?, ?)', (kind, record_id, joined, popularity))
+            conn.execute('DELETE FROM catalog_fts WHERE rowid = ?', (rowid,))
+            conn.execute('INSERT INTO catalog_fts (rowid, names, kind, popularity) VALUES (?, ?, ?, ?)', (rowid, joined, kind, popularity or 0))
+        except sqlite3.Error as e:
+            print(f"Lỗi Catalog (upsert): {e}")
+
+    # Duyệt toàn bộ response AniList và ghi lại mọi media/nhân vật gặp được
+    def index_records(self, node):
+        if isinstance(node, list):
+            for item in node:
+                self.index_records(item)
+            return
+        if not isinstance(node, dict):
+            return
+        if isinstance(node.get('id'), int):
+            title = node.get('title')
+            name = node.get('name')
+            if isinstance(title, dict) and node.get('type') in ('ANIME', 'MANGA'):
+                names = [title.get('romaji'), title.get('english'), title.get('native')] + (node.get('synonyms') or [])
+                self.upsert(node['type'], node['id'], names, node.get('popularity'))
+            elif isinstance(name, dict) and name.get('full'):
+                names = [name.get('full'), name.get('native')] + (name.get('alternative') or [])
+                self.upsert("CHARACTER", node['id'], names, node.get('favourites'))
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                self.index_records(value)
+
+    # Ghi truy vấn người dùng thành tên phụ của kết quả AniList trả về, lần sau cùng truy vấn sẽ khớp ngay trong catalog
+    def add_alias(self, kind, record_id, query):
+        alias = normalize_title(query)
+        if isinstance(record_id, int) and len(alias) >= 3:
+            self.upsert(kind, record_id, [alias])
+
+    def store_detail(self, kind, record):
+        conn = self.get_conn()
+        if conn is None or record is None or not isinstance(record.id, int):
+            return
+        try:
+            conn.execute('UPDATE catalog SET detail = ?, detail_updated = ? WHERE kind = ? AND id = ?',
+                         (json.dumps(encode_records(record)), time.time(), kind, record.id))
+        except sqlite3.Error as e:
+            print(f"Lỗi Catalog (store_detail): {e}")
+
+    def get_detail(self, kind, record_id, max_age=CATALOG_DETAIL_TTL):
+        conn = self.get_conn()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute('SELECT detail FROM catalog WHERE kind = ? AND id = ? AND detail_updated > ?',
+                               (kind, record_id, time.time() - max_age)).fetchone()
+            return decode_records(json.loads(row[0])) if row and row[0] else None
+        except sqlite3.Error as e:
+            print(f"Lỗi Catalog (get_detail): {e}")
+            return None
+
+    # Khớp một phần chỉ được điểm theo tỉ lệ tên mà truy vấn phủ được ("one" trong "one piece" chỉ 0.33),
+    # nên chỉ tên trùng hoặc gần trùng (gõ sai vài ký tự) mới vượt CATALOG_MIN_SCORE, còn lại để AniList tìm
+    @staticmethod
+    def match_score(query, names):
+        best = 0.0
+        for name in names.split('\n'):
+            if name == query:
+                return 1.0
+            if query in name:
+                best = max(best, len(query) / len(name))
+            else:
+                best = max(best, difflib.SequenceMatcher(None, query, name).ratio())
+        return best
+
+    # Trả về id AniList khớp nhất với truy vấn (hoặc None nếu không đủ tin cậy)
+    def resolve(self, kind, query):
+        conn = self.get_conn()
+        query = normalize_title(query)
+        if conn is None or len(query) < 3:
+            return None
+        trigrams = {query[i:i + 3] for i in range(len(query) - 2)}
+        match_expr = ' OR '.join('"' + trigram.replace('"', '""') + '"' for trigram in trigrams)
+        try:
+            rows = conn.execute(
+                'SELECT rowid, names, popularity FROM catalog_fts WHERE catalog_fts MATCH ? AND kind = ? ORDER BY rank LIMIT 20',
+                (match_expr, kind)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Lỗi Catalog (resolve): {e}")
+            return None
+        best = None
+        for rowid, names, popularity in rows:
+            candidate = (self.match_score(query, names), popularity or 0, rowid % 1_000_000_000)
+            if best is None or candidate > best:
+                best = candidate
+        if best and best[0] >= CATALOG_MIN_SCORE:
+            return best[2]
+        return None
+
+catalog = Catalog(shared_store)
+
+# Lớp PollSchedule: khoảng quét của từng feed, rút ngắn khi nội dung thay đổi và giãn ra khi đứng yên (trong POLL_BOUNDS)
+class PollSchedule:
+    def __init__(self, store):
+        self.store = store
+        self.schema_ready = False
+
+    def get_conn(self):
+        conn = self.store.get_conn()
+        if not self.schema_ready:
+            conn.execute('CREATE TABLE IF NOT EXISTS poll_schedule (feed TEXT PRIMARY KEY, interval REAL, next_due REAL)')
+            self.schema_ready = True
+        return conn
+
+    @staticmethod
+    def bounds(feed):
+        return POLL_BOUNDS[feed.split(':')[0]]
+
+    def interval(self, feed):
+        low, high = self.bounds(feed)
+        try:
+            row = self.get_conn().execute('SELECT interval FROM poll_schedule WHERE feed = ?', (feed,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Lỗi PollSchedule (interval {feed}): {e}")
+            row = None
+        return row[0] if row else min(max(CHECK_INTERVAL, low), high)
+
+    # Giữ lượt quét khi feed đến hạn, để worker và các gateway không cùng gọi upstream
+    def claim(self, feed):
+        now = time.time()
+        interval = self.interval(feed)
+        try:
+            conn = self.get_conn()
+            conn.execute('INSERT OR IGNORE INTO poll_schedule (feed, interval, next_due) VALUES (?, ?, ?)', (feed, interval, now))
+            return conn.execute(
+                'UPDATE poll_schedule SET next_due = ? WHERE feed = ? AND next_due <= ?', (now + interval, feed, now)
+            ).rowcount == 1
+        except sqlite3.Error as e:
+            print(f"Lỗi PollSchedule (claim {feed}): {e}")
+            return True
+
+    def record(self, feed, changed):
+        low, high = self.bounds(feed)
+        interval = min(max(self.interval(feed) * (POLL_TIGHTEN if changed else POLL_RELAX), low), high)
+        try:
+            self.get_conn().execute(
+                'UPDATE poll_schedule SET interval = ?, next_due = ? WHERE feed = ?', (interval, time.time() + interval, feed)
+            )
+        except sqlite3.Error as e:
+            print(f"Lỗi PollSchedule (record {feed}): {e}")
+        return interval
+
+poll_schedule = PollSchedule(shared_store)
+
+# Lớp RankingHistory: lưu mỗi lần quét bảng xếp hạng dạng số nguyên (thể loại, thời điểm, media id, hạng, điểm)
+class RankingHistory:
+    def __init__(self, store):
+        self.store = store
+        self.schema_ready = False
+
+    def get_conn(self):
+        conn = self.store.get_conn()
+        if not self.schema_ready:
+            conn.execute('''CREATE TABLE IF NOT EXISTS ranking_history (
+                genre_id INTEGER, swept_at INTEGER, media_id INTEGER, rank INTEGER, score INTEGER)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ranking_history_genre_time ON ranking_history (genre_id, swept_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS media_titles (media_id INTEGER PRIMARY KEY, title TEXT)')
+            self.schema_ready = True
+        return conn
+
+    @staticmethod
+    def genre_id(genre):
+        return GENRE_LIST.index(genre) + 1 if genre else 0
+
+    def record(self, genre, ranking):
+        conn = self.get_conn()
+        swept_at = int(time.time())
+        genre_id = self.genre_id(genre)
+        try:
+            conn.execute('BEGIN')
+            conn.executemany('INSERT OR REPLACE INTO media_titles (media_id, title) VALUES (?, ?)',
+                             [(media_id, title) for media_id, title, _ in ranking])
+            conn.executemany('INSERT INTO ranking_history (genre_id, swept_at, media_id, rank, score) VALUES (?, ?, ?, ?, ?)',
+                             [(genre_id, swept_at, media_id, rank, score) for rank, (media_id, _, score) in enumerate(ranking, 1)])
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            print(f"Lỗi RankingHistory (record): {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+
+    # Tổng hợp theo media trong khoảng thời gian: hạng tốt nhất, hạng gần nhất, số lần có mặt, điểm đầu/cuối
+    def summarize(self, genre, since, until, limit=10):
+        try:
+            return self.get_conn().execute('''
+                SELECT h.media_id, t.title, MIN(h.rank), COUNT(*),
+                       (SELECT rank FROM ranking_history WHERE genre_id = h.genre_id AND media_id = h.media_id
+                        AND swept_at BETWEEN ? AND ? ORDER BY swept_at DESC LIMIT 1),
+                       (SELECT score FROM ranking_history WHERE genre_id = h.genre_id AND media_id = h.media_id
+                        AND swept_at BETWEEN ? AND ? ORDER BY swept_at ASC LIMIT 1),
+                       (SELECT score FROM ranking_history WHERE genre_id = h.genre_id AND media_id = h.media_id
+                        AND swept_at BETWEEN ? AND ? ORDER BY swept_at DESC LIMIT 1)
+                FROM ranking_history h LEFT JOIN media_titles t ON t.media_id = h.media_id
+                WHERE h.genre_id = ? AND h.swept_at BETWEEN ? AND ?
+                GROUP BY h.media_id ORDER BY MIN(h.rank), COUNT(*) DESC LIMIT ?''',
+                (since, until, since, until, since, until, self.genre_id(genre), since, until, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Lỗi RankingHistory (summarize): {e}")
+            return []
+
+    def get_range(self, genre, since, until):
+        try:
+            rows = self.get_conn().execute('''
+                SELECT h.swept_at, h.media_id, t.title, h.rank, h.score
+                FROM ranking_history h LEFT JOIN media_titles t ON t.media_id = h.media_id
+                WHERE h.genre_id = ? AND h.swept_at BETWEEN ? AND ?
+                ORDER BY h.swept_at, h.rank''',
+                (self.genre_id(genre), since, until)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Lỗi RankingHistory (get_range): {e}")
+            return []
+        sweeps = []
+        for swept_at, media_id, title, rank, score in rows:
+            if not sweeps or sweeps[-1]["swept_at"] != swept_at:
+                sweeps.append({"swept_at": swept_at, "entries": []})
+            sweeps[-1]["entries"].append({"media_id": media_id, "title": title, "rank": rank, "score": score})
+        return sweeps
+
+ranking_history = RankingHistory(shared_store)
+
+# Lớp WaifuAPI (dùng Waifu.im API)
+class WaifuAPI:
+    def __init__(self):
+        self.session = None
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def get_random_waifu(self, nsfw=False):
+        params = {
+            "is_nsfw": "true" if nsfw else "false",
+            "many": "false"
+        }
+        session = await self.get_session()
+        for attempt in range(3):
+            try:
+                await shared_store.acquire("waifu_im")
+                async with session.get(f"{WAIFU_IM_API}/search", params=params) as resp:
+                    if resp.status != 200:
+                        print(f"Lỗi Waifu.im API: Mã trạng thái {resp.status}")
+                        if attempt < 2:
+                            await asyncio.sleep(2)
+                            continue
+                        return None
+                    result = await resp.json()
+                    if not result or 'images' not in result or not result['images']:
+                        print("Lỗi Waifu.im API: Không nhận được dữ liệu hợp lệ")
+                        return None
+                    return parse_waifu_image(result['images'][0])
+            except Exception as e:
+                print(f"Lỗi Waifu.im API: {e}")
+                if attempt < 2:
+                    await asyncio.sleep(2)
+                    continue
+                return None
+
+    async def get_popular_waifus(self, limit=10):
+        params = {
+            "included_tags": "waifu",
+            "many": "true",
+            "limit": limit
+        }
+        session = await self.get_session()
+        for attempt in range(3):
+            try:
+                await shared_store.acquire("waifu_im")
+                async with session.get(f"{WAIFU_IM_API}/search", params=params) as resp:
+                    if resp.status != 200:
+                        print(f"Lỗi Waifu.im API (popular): Mã trạng thái {resp.status}")
+                        if attempt < 2:
+                            await asyncio.sleep(2)
+                            continue
+                        return None
+                    result = await resp.json()
+                    if not result or 'images' not in result or not result['images']:
+                        print("Lỗi Waifu.im API (popular): Không nhận được dữ liệu hợp lệ")
+                        return None
+                    return [parse_waifu_image(image) for image in result['images']]
+            except Exception as e:
+                print(f"Lỗi Waifu.im API (popular): {e}")
+                if attempt < 2:
+                    await asyncio.sleep(2)
+                    continue
+                return None
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+# Lớp AniListClient
+class AniListClient:
+    def __init__(self):
+        self.session = None
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    # parse: hàm chuyển phần 'data' của response thành record; cache lưu kết quả đã parse
+    # cached_only=True: chỉ đọc cache, không gọi AniList (dùng cho kết quả tạm của slash command)
+    # fresh=True: bỏ qua cache và luôn hỏi AniList (poller cần biết feed có thật sự đổi); kết quả vẫn ghi vào cache
+    async def query(self, query, variables=None, parse=None, cached_only=False, fresh=False):
+        cache_key = SharedStore.make_key(str((CACHE_SCHEMA, query, variables)))
+        if not fresh:
+            if cache_key in cache:
+                return cache[cache_key]
+            shared = shared_store.cache_get(cache_key)
+            if shared is not None:
+                cache[cache_key] = shared
+                return shared
+        if cached_only:
+            return None
+        session = await self.get_session()
+        for attempt in range(3):
+            try:
+                await shared_store.acquire("anilist")
+                async with session.post(ANILIST_API, json={"query": query, "variables": variables}) as resp:
+                    if resp.status != 200:
+                        print(f"Lỗi AniList API: Mã trạng thái {resp.status}")
+                        if resp.status == 400:
+                            print(f"Truy vấn lỗi: {query}, Biến: {variables}")
+                        if attempt < 2:
+                            await asyncio.sleep(2)
+                            continue
+                        return None
+                    # AniList không hỗ trợ ETag: so hash nội dung, giống lần trước thì dùng lại kết quả đã parse
+                    body = await resp.read()
+                    content_hash = hashlib.sha1(body).hexdigest()
+                    validator = shared_store.get_validator(cache_key)
+                    if validator and validator['content_hash'] == content_hash:
+                        result = validator['value']
+                        shared_store.touch_validator(cache_key)
+                    else:
+                        result = json.loads(body)
+                        if not result or 'data' not in result:
+                            print("Lỗi AniList API: Không nhận được dữ liệu hợp lệ")
+                            return None
+                        catalog.index_records(result.get('data'))
+                        if parse:
+                            result = parse(result['data'] or {})
+                        shared_store.set_validator(cache_key, result, content_hash=content_hash)
+                    cache[cache_key] = result
+                    shared_store.cache_set(cache_key, result)
+                    return result
+            except Exception as e:
+                print(f"Lỗi AniList API: {e}")
+                if attempt < 2:
+                    await asyncio.sleep(2)
+                    continue
+                return None
+
+    async def search_media(self, media_type, query):
+        gql_query = """
+        query ($search: String, $type: MediaType) {
+            Media(search: $search, type: $type) {
+                id
+                type
+                title { romaji english native }
+                synonyms
+                popularity
+                description
+                averageScore
+                status
+                startDate { year month day }
+                endDate { year month day }
+                episodes
+                chapters
+                coverImage { large }
+                siteUrl
+            }
+        }
+        """
+        variables = {"search": query, "type": media_type.upper()}
+        return await self.query(gql_query, variables, lambda data: parse_media(data.get('Media')))
+
+    async def search_character(self, query):
+        gql_query = """
+        query ($search: String) {
+            Character(search: $search) {
+                id
+                name { full native alternative }
+                favourites
+                description
+                image { large }
+                siteUrl
+            }
+        }
+        """
+        variables = {"search": query}
+        return await self.query(gql_query, variables, lambda data: parse_character(data.get('Character')))
+
+    async def get_media(self, media_type, media_id):
+        gql_query = """
+        query ($id: Int, $type: MediaType) {
+            Media(id: $id, type: $type) {
+                id
+                type
+                title { romaji english native }
+                synonyms
+                popularity
+                description
+                averageScore
+                status
+                startDate { year month day }
+                endDate { year month day }
+                episodes
+                chapters
+                coverImage { large }
+                siteUrl
+            }
+        }
+        """
+        variables = {"id": media_id, "type": media_type.upper()}
+        return await self.query(gql_query, variables, lambda data: parse_media(data.get('Media')))
+
+    async def get_character(self, character_id):
+        gql_query = """
+        query ($id: Int) {
+            Character(id: $id) {
+                id
+                name { full native alternative }
+                favourites
+                description
+                image { large }
+                siteUrl
+            }
+        }
+        """
+        variables = {"id": character_id}
+        return await self.query(gql_query, variables, lambda data: parse_character(data.get('Character')))
+
+    # Nạp hàng loạt vào catalog các media/nhân vật phổ biến nhất
+    async def seed_catalog(self, pages=10):
+        gql_query = """
+        query ($page: Int, $type: MediaType) {
+            Page(page: $page, perPage: 50) {
+                pageInfo { hasNextPage }
+                media(type: $type, sort: POPULARITY_DESC) {
+                    id
+                    type
+                    title { romaji english native }
+                    synonyms
+                    popularity
+                }
+            }
+        }
+        """
+        character_query = """
+        query ($page: Int) {
+            Page(page: $page, perPage: 50) {
+                pageInfo { hasNextPage }
+                characters(sort: FAVOURITES_DESC) {
+                    id
+                    name { full native alternative }
+                    favourites
+                }
+            }
+        }
+        """
+        jobs = [(gql_query, {"type": "ANIME"}), (gql_query, {"type": "MANGA"}), (character_query, {})]
+        for query, variables in jobs:
+            for page in range(1, pages + 1):
+                data = await self.query(query, dict(variables, page=page))
+                if not data or not data.get('data', {}).get('Page', {}).get('pageInfo', {}).get('hasNextPage'):
+                    break
+            print(f"Catalog: đã nạp {variables.get('type', 'CHARACTER')} tới trang {page}")
+
+    async def get_trending(self, media_type, limit=10, genre=None, fresh=False):
+        gql_query = """
+        query ($type: MediaType, $perPage: Int, $genre: String) {
+            Page(perPage: $perPage) {
+                media(type: $type, sort: TRENDING_DESC, genre: $genre) {
+                    id
+                    type
+                    title { romaji english }
+                    popularity
+                    averageScore
+                    startDate { year month day }
+                }
+            }
+        }
+        """
+        variables = {"type": media_type.upper(), "perPage": limit, "genre": genre}
+        return await self.query(gql_query, variables, page_items('media', parse_media), fresh=fresh)
+
+    async def get_top_characters(self, page=1, per_page=50, cached_only=False):
+        gql_query = """
+        query ($page: Int, $perPage: Int) {
+            Page(page: $page, perPage: $perPage) {
+                pageInfo { hasNextPage }
+                characters(sort: FAVOURITES_DESC) {
+                    id
+                    name { full }
+                    description
+                    media {
+                        nodes {
+                            id
+                            type
+                            title { romaji }
+                        }
+                    }
+                    image { large }
+                }
+            }
+        }
+        """
+        variables = {"page": page, "perPage": per_page}
+        return await self.query(gql_query, variables, page_with_info('characters', parse_character), cached_only)
+
+    # Duyệt lần lượt các trang top nhân vật đến khi đủ `limit` nhân vật nữ hoặc chạm giới hạn số trang
+    async def get_top_female_characters(self, limit=10, max_pages=TOP_WAIFU_MAX_PAGES, cached_only=False):
+        female_characters = []
+        for page in range(1, max_pages + 1):
+            result = await self.get_top_characters(page=page, cached_only=cached_only)
+            if not result:
+                if page == 1:
+                    return None
+                break
+            female_characters.extend(character for character in result['items'] if character.female)
+            if len(female_characters) >= limit or not result['has_next']:
+                break
+        return female_characters[:limit]
+
+    # Anime ra mắt hôm nay có id lớn hơn id_greater (high-watermark của lần quét trước)
+    async def get_new_releases_today(self, id_greater=0, fresh=False):
+        today = datetime.date.today()
+        gql_query = """
+        query ($perPage: Int, $after: FuzzyDateInt, $before: FuzzyDateInt, $idGreater: Int) {
+            Page(perPage: $perPage) {
+                media(type: ANIME, sort: ID, startDate_greater: $after, startDate_lesser: $before, id_greater: $idGreater) {
+                    id
+                    idMal
+                    type
+                    title { romaji english }
+                    description
+                    coverImage { large }
+                    siteUrl
+                    startDate { year month day }
+                }
+            }
+        }
+        """
+        variables = {
+            "perPage": 50,
+            "after": int((today - datetime.timedelta(days=1)).strftime('%Y%m%d')),
+            "before": int((today + datetime.timedelta(days=1)).strftime('%Y%m%d')),
+            "idGreater": id_greater
+        }
+        return await self.query(gql_query, variables, page_items('media', parse_media), fresh=fresh)
+
+    async def get_characters_from_anime(self, anime_id):
+        gql_query = """
+        query ($id: Int) {
+            Media(id: $id) {
+                characters(sort: RELEVANCE, perPage: 10) {
+                    nodes {
+                        id
+                        name { full }
+                        description
+                        image { large }
+                        siteUrl
+                    }
+                }
+            }
+        }
+        """
+        variables = {"id": anime_id}
+        return await self.query(gql_query, variables, lambda data: [
+            parse_character(node) for node in ((data.get('Media') or {}).get('characters') or {}).get('nodes') or []
+        ])
+
+    async def get_airing_today(self, fresh=False):
+        today = int(datetime.datetime.now().timestamp())
+        tomorrow = int((datetime.datetime.now() + datetime.timedelta(days=1)).timestamp())
+        gql_query = """
+        query ($airingAt_greater: Int, $airingAt_lesser: Int) {
+            Page(perPage: 5) {
+                airingSchedules(airingAt_greater: $airingAt_greater, airingAt_lesser: $airingAt_lesser) {
+                    airingAt
+                    episode
+                    media {
+                        id
+                        type
+                        title { romaji }
+                        description
+                        coverImage { large }
+                        siteUrl
+                    }
+                }
+            }
+        }
+        """
+        variables = {"airingAt_greater": today, "airingAt_lesser": tomorrow}
+        return await self.query(gql_query, variables, page_items('airingSchedules', parse_airing_slot), fresh=fresh)
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+# Lớp JikanClient
+class JikanClient:
+    def __init__(self):
+        self.session = None
+        self.schema_ready = False
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    @staticmethod
+    def make_cache_key(endpoint):
+        return SharedStore.make_key(f"jikan_v{CACHE_SCHEMA}_{endpoint}")
+
+    # fresh=True: bỏ qua cache, vẫn gửi request có điều kiện nên trang không đổi chỉ tốn một 304
+    async def query(self, endpoint, parse=None, fresh=False):
+        cache_key = self.make_cache_key(endpoint)
+        if not fresh:
+            if cache_key in cache:
+                return cache[cache_key]
+            shared = shared_store.cache_get(cache_key)
+            if shared is not None:
+                cache[cache_key] = shared
+                return shared
+        session = await self.get_session()
+        url = f"{JIKAN_API}{endpoint}"
+        # Request có điều kiện: Jikan trả 304 nếu dữ liệu chưa đổi kể từ lần tải trước
+        validator = shared_store.get_validator(cache_key)
+        headers = {}
+        if validator and validator['etag']:
+            headers['If-None-Match'] = validator['etag']
+        if validator and validator['last_modified']:
+            headers['If-Modified-Since'] = validator['last_modified']
+        for attempt in range(3):
+            try:
+                await shared_store.acquire("jikan")
+                async with session.get(url, headers=headers) as resp:
+                    if resp.status == 304 and validator:
+                        result = validator['value']
+                        shared_store.touch_validator(cache_key)
+                        cache[cache_key] = result
+                        shared_store.cache_set(cache_key, result)
+                        return result
+                    if resp.status != 200:
+                        print(f"Lỗi Jikan API: Mã trạng thái {resp.status}")
+                        if resp.status == 400:
+                            print(f"Endpoint lỗi: {url}")
+                        if attempt < 2:
+                            await asyncio.sleep(2)
+                            continue
+                        return None
+                    # Như AniList: body giống lần trước (server bỏ qua header điều kiện) thì không parse lại
+                    body = await resp.read()
+                    content_hash = hashlib.sha1(body).hexdigest()
+                    if validator and validator['content_hash'] == content_hash:
+                        result = validator['value']
+                        shared_store.touch_validator(cache_key)
+                    else:
+                        result = json.loads(body)
+                        if not result or 'data' not in result:
+                            print("Lỗi Jikan API: Không nhận được dữ liệu hợp lệ")
+                            return None
+                        if parse:
+                            result = parse(result)
+                        shared_store.set_validator(cache_key, result, etag=resp.headers.get('ETag'),
+                                                   last_modified=resp.headers.get('Last-Modified'),
+                                                   content_hash=content_hash)
+                    cache[cache_key] = result
+                    shared_store.cache_set(cache_key, result)
+                    return result
+            except Exception as e:
+                print(f"Lỗi Jikan API: {e}")
+                if attempt < 2:
+                    await asyncio.sleep(2)
+                    continue
+                return None
+
+    def get_conn(self):
+        conn = shared_store.get_conn()
+        if not self.schema_ready:
+            conn.execute('''CREATE TABLE IF NOT EXISTS jikan_season (
+                season TEXT, mal_id INTEGER, page INTEGER, title TEXT, title_english TEXT,
+                synopsis TEXT, url TEXT, cover TEXT, aired_date TEXT, synced REAL,
+                PRIMARY KEY (season, mal_id))''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jikan_season_aired ON jikan_season (aired_date)')
+            conn.execute('CREATE TABLE IF NOT EXISTS jikan_season_pages (season TEXT, page INTEGER, hash TEXT, PRIMARY KEY (season, page))')
+            conn.execute('CREATE TABLE IF NOT EXISTS jikan_sync (season TEXT PRIMARY KEY, synced REAL)')
+            self.schema_ready = True
+        return conn
+
+    # Theo nhịp quét hiện tại của poll 'seasons' (giãn tới 6 giờ khi mùa không đổi); khi worker chạy, poll đó đồng bộ
+    # trước nên get_new_releases_today chỉ đọc bảng đã có
+    def needs_sync(self, season):
+        row = self.get_conn().execute('SELECT synced FROM jikan_sync WHERE season = ?', (season,)).fetchone()
+        return row is None or time.time() - row[0] > poll_schedule.interval('seasons')
+
+    # Đồng bộ toàn bộ danh sách anime của mùa (now/upcoming), chỉ ghi lại những trang có thay đổi
+    async def sync_season(self, season="now"):
+        conn = self.get_conn()
+        started = time.time()
+        page = 1
+        changed_pages = 0
+        complete = False
+        while page <= JIKAN_SEASON_MAX_PAGES:
+            endpoint = f"/seasons/{season}?page={page}&limit=25"
+            result = await self.query(endpoint, lambda raw: {
+                "media": [parse_jikan_anime(anime) for anime in raw['data']],
+                "has_next_page": raw.get('pagination', {}).get('has_next_page', False)
+            }, fresh=True)
+            if not result:
+                break
+            # Hash body thô do query ghi lại: trang không đổi thì query đã bỏ qua bước parse, ở đây bỏ qua bước ghi DB
+            page_hash = shared_store.get_content_hash(self.make_cache_key(endpoint))
+            row = conn.execute('SELECT hash FROM jikan_season_pages WHERE season = ? AND page = ?', (season, page)).fetchone()
+            conn.execute('BEGIN')
+            try:
+                if row and page_hash and row[0] == page_hash:
+                    conn.execute('UPDATE jikan_season SET synced = ? WHERE season = ? AND page = ?', (started, season, page))
+                else:
+                    changed_pages += 1
+                    for anime in result['media']:
+                        conn.execute(
+                            '''INSERT OR REPLACE INTO jikan_season
+                            (season, mal_id, page, title, title_english, synopsis, url, cover, aired_date, synced)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                            (season, anime.mal_id, page, anime.title, anime.title_english,
+                             anime.description, anime.url, anime.cover,
+                             datetime.date(*anime.start_date).isoformat() if anime.start_date and None not in anime.start_date else None,
+                             started)
+                        )
+                    conn.execute('INSERT OR REPLACE INTO jikan_season_pages (season, page, hash) VALUES (?, ?, ?)', (season, page, page_hash))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            if not result['has_next_page']:
+                complete = True
+                break
+            page += 1
+        if complete:
+            # Chỉ dọn các mục đã biến mất khi đã đọc hết mọi trang
+            conn.execute('DELETE FROM jikan_season WHERE season = ? AND synced < ?', (season, started))
+            conn.execute('DELETE FROM jikan_season_pages WHERE season = ? AND page > ?', (season, page))
+            conn.execute('INSERT OR REPLACE INTO jikan_sync (season, synced) VALUES (?, ?)', (season, time.time()))
+        print(f"Jikan: đồng bộ mùa {season} {page} trang, {changed_pages} trang thay đổi")
+        return changed_pages
+
+    # Trả về True nếu có trang nào thay đổi
+    async def sync_seasons(self):
+        changed = False
+        for season in JIKAN_SEASONS:
+            changed = await self.sync_season(season) > 0 or changed
+        return changed
+
+    def get_releases_on(self, date):
+        rows = self.get_conn().execute(
+            '''SELECT mal_id, title, title_english, synopsis, url, cover FROM jikan_season
+            WHERE aired_date = ? GROUP BY mal_id''',
+            (date.isoformat(),)
+        ).fetchall()
+        return [
+            Media(mal_id=mal_id, type="ANIME", title=title, title_english=title_english,
+                  description=synopsis, url=url, cover=cover, start_date=(date.year, date.month, date.day))
+            for mal_id, title, title_english, synopsis, url, cover in rows
+        ]
+
+    async def get_new_releases_today(self):
+        if self.needs_sync("now"):
+            await self.sync_season("now")
+        # Chưa đồng bộ trọn mùa lần nào thì chưa biết hôm nay có gì: trả về None thay vì danh sách rỗng
+        if self.get_conn().execute('SELECT 1 FROM jikan_sync WHERE season = ?', ("now",)).fetchone() is None:
+            return None
+        return self.get_releases_on(datetime.date.today())
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+# Khởi tạo client
+anilist = AniListClient()
+jikan = JikanClient()
+waifu_api = WaifuAPI()
+
+# Hàm kiểm tra nhân vật nữ
+def is_female_character(character):
+    name = character['name']['full'].lower()
+    description = (character.get('description') or '').lower()
+    name_matches_female = any(pattern in name for pattern in FEMALE_NAME_PATTERNS)
+    desc_matches_female = any(keyword in description for keyword in FEMALE_KEYWORDS)
+    desc_matches_male = any(keyword in description for keyword in MALE_KEYWORDS)
+    is_female = (name_matches_female or desc_matches_female) and not desc_matches_male
+    print(f"Nhân vật: {character['name']['full']}, Nữ: {is_female}, Tên khớp: {name_matches_female}, Mô tả nữ: {desc_matches_female}, Mô tả nam: {desc_matches_male}")
+    return is_female
+
+# Các hàm tính feed: worker chạy định kỳ và ghi vào store, gateway chỉ đọc ra để gửi.
+# Chúng chạy theo lịch quét nên hỏi thẳng upstream (fresh=True) thay vì đọc lại response trong cache.
+def is_released_today(start_date, today):
+    return tuple(start_date or ()) == (today.year, today.month, today.day)
+
+async def fetch_ranking(genre):
+    media_list = await anilist.get_trending('anime', limit=10, genre=genre, fresh=True)
+    if not media_list:
+        return None
+    ranking = [[anime.id, anime.title, anime.score] for anime in media_list]
+    ranking_history.record(genre, ranking)
+    return ranking
+
+# So sánh với bảng xếp hạng trước: mới lên bảng, lên/xuống bao nhiêu hạng, điểm thay đổi
+def describe_movement(old_ranking, new_ranking):
+    old_positions = {entry[0]: (rank, entry[2]) for rank, entry in enumerate(old_ranking, 1) if len(entry) == 3}
+    movements = []
+    for rank, (media_id, title, score) in enumerate(new_ranking, 1):
+        if media_id not in old_positions:
+            movements.append("🆕 Mới")
+            continue
+        old_rank, old_score = old_positions[media_id]
+        if old_rank > rank:
+            movement = f"🔼 +{old_rank - rank}"
+        elif old_rank < rank:
+            movement = f"🔽 -{rank - old_rank}"
+        else:
+            movement = "➖"
+        if score is not None and old_score is not None and score != old_score:
+            movement += f" (điểm {score - old_score:+d})"
+        movements.append(movement)
+    return movements
+
+async def fetch_anilist_releases(today):
+    day = today.date().isoformat()
+    known = shared_store.get_feed(feed_name('anilist_releases'), 86400) or []
+    watermark = shared_store.get_watermark('anime', day)
+    fetched = await anilist.get_new_releases_today(id_greater=watermark, fresh=True)
+    if fetched is None:
+        # Lỗi mạng: vẫn dùng được danh sách đã xử lý hôm nay, chưa có gì thì báo lỗi cho nơi gọi
+        return known or None
+    releases = []
+    for anime in fetched:
+        watermark = max(watermark, anime.id)
+        if is_released_today(anime.start_date, today):
+            releases.append({
+                "title": anime.title,
+                "titles": [anime.title, anime.title_english],
+                "description": anime.description or 'Không có mô tả',
+                "url": anime.url,
+                "cover": anime.cover,
+                "id": anime.id,
+                "mal_id": anime.mal_id
+            })
+    print(f"AniList: bỏ qua {len(known)} anime đã xử lý, {len(releases)} anime mới (watermark id {watermark})")
+    if releases:
+        known.extend(releases)
+        shared_store.set_watermark('anime', day, watermark, feed_name('anilist_releases'), known)
+    else:
+        shared_store.set_watermark('anime', day, watermark)
+    return known
+
+async def fetch_jikan_releases(today):
+    fetched = await jikan.get_new_releases_today()
+    if fetched is None:
+        return None
+    releases = []
+    for anime in fetched:
+        releases.append({
+            "title": anime.title,
+            "titles": [anime.title, anime.title_english],
+            "description": anime.description or 'Không có mô tả',
+            "url": anime.url,
+            "cover": anime.cover,
+            "mal_id": anime.mal_id
+        })
+    return releases
+
+# Gộp kết quả nhiều nguồn, trùng nhau khi cùng MAL id hoặc cùng tên (đã chuẩn hóa)
+def merge_releases(results):
+    merged = []
+    index = {}
+    for source, releases in results:
+        for release in releases:
+            release = dict(release)
+            titles = [title for title in release.pop('titles') if title]
+            keys = [f"title:{normalize_title(title)}" for title in titles]
+            if release.get('mal_id'):
+                keys.insert(0, f"mal:{release['mal_id']}")
+            entry = next((index[key] for key in keys if key in index), None)
+            if entry is None:
+                entry = dict(release, sources=[], titles=[])
+                merged.append(entry)
+            else:
+                for field, value in release.items():
+                    if entry.get(field) in (None, 'Không có mô tả'):
+                        entry[field] = value
+            if source not in entry['sources']:
+                entry['sources'].append(source)
+            entry['titles'].extend(title for title in titles if title not in entry['titles'])
+            for key in keys:
+                index.setdefault(key, entry)
+    for entry in merged:
+        entry['source'] = " & ".join(entry['sources'])
+    return merged
+
+# Gọi AniList và Jikan song song; nguồn nào quá hạn thì bỏ qua và trả về phần đã có
+async def fetch_new_anime_today():
+    today = datetime.datetime.now()
+    fetchers = {
+        "AniList": asyncio.create_task(fetch_anilist_releases(today)),
+        "Jikan (MyAnimeList)": asyncio.create_task(fetch_jikan_releases(today)),
+    }
+    done, pending = await asyncio.wait(fetchers.values(), timeout=RELEASE_FETCH_DEADLINE)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    results = []
+    failed = False
+    for source, task in fetchers.items():
+        if task not in done:
+            print(f"Nguồn {source} quá {RELEASE_FETCH_DEADLINE}s, bỏ qua")
+            failed = True
+        elif task.exception():
+            print(f"Lỗi nguồn {source}: {task.exception()}")
+            failed = True
+        elif task.result() is None:
+            print(f"Nguồn {source} không trả về dữ liệu, bỏ qua")
+            failed = True
+        else:
+            results.append((source, task.result()))
+    releases = merge_releases(results)
+    # Có nguồn lỗi mà không còn gì để gửi: trả về None để giữ feed cũ thay vì ghi đè bằng danh sách rỗng
+    if failed and not releases:
+        return None
+    return releases
+
+async def fetch_new_waifu_today():
+    today = datetime.datetime.now()
+    day = today.date().isoformat()
+    known = shared_store.get_feed(feed_name('waifu_characters'), 86400) or []
+    known_ids = {character.id for character in known}
+    watermark = shared_store.get_watermark('waifu', day)
+    fetched = await anilist.get_new_releases_today(id_greater=watermark, fresh=True)
+    if fetched is None:
+        return known or None
+    new_waifu = []
+    for anime in fetched:
+        if is_released_today(anime.start_date, today):
+            characters = await anilist.get_characters_from_anime(anime.id)
+            if characters is None:
+                # Lỗi mạng: dừng ở đây để lần quét sau thử lại từ anime này
+                break
+            for character in characters:
+                if character.id not in known_ids and character.female:
+                    known_ids.add(character.id)
+                    new_waifu.append(character)
+        watermark = max(watermark, anime.id)
+    print(f"AniList: bỏ qua {len(known)} waifu đã phân loại, {len(new_waifu)} waifu mới (watermark id {watermark})")
+    if new_waifu:
+        known.extend(new_waifu)
+        shared_store.set_watermark('waifu', day, watermark, feed_name('waifu_characters'), known)
+    else:
+        shared_store.set_watermark('waifu', day, watermark)
+    return known
+
+# None khi AniList lỗi để load_feed giữ feed cũ; danh sách rỗng nghĩa là hôm nay thật sự không có tập nào
+async def fetch_airing_today():
+    return await anilist.get_airing_today(fresh=True)
+
+def feed_name(kind, genre=None):
+    if kind == 'ranking':
+        return f"v{CACHE_SCHEMA}:ranking:{genre or 'default'}"
+    return f"v{CACHE_SCHEMA}:{kind}:{datetime.date.today().isoformat()}"
+
+def poll_feed(kind, genre=None):
+    return f"ranking:{genre or 'default'}" if kind == 'ranking' else kind
+
+def worker_alive():
+    return time.time() - shared_store.last_beat('worker') < WORKER_STALE_AFTER
+
+# Đọc feed do worker tính sẵn; gateway không nhận lịch quét. Worker không chạy (heartbeat cũ) thì gateway tự tính
+# feed khi nó cũ hơn nhịp quét hiện tại của `poll`. Upstream lỗi thì dùng lại bản đang có dù cũ.
+async def load_feed(name, producer, *args, poll=None):
+    if worker_alive():
+        max_age = math.inf
+    else:
+        max_age = poll_schedule.interval(poll) if poll else CHECK_INTERVAL
+    data = shared_store.get_feed(name, max_age)
+    if data is not None:
+        return data
+    data = await producer(*args)
+    if data is None:
+        return shared_store.get_feed(name, math.inf)
+    shared_store.set_feed(name, data)
+    return data
+
+# Worker: quét upstream định kỳ và ghi feed vào store, tách khỏi event loop của gateway
+# Chỉ quét những feed đã đến hạn theo poll_schedule
+async def refresh_feeds():
+    started = time.time()
+    refreshed = []
+    if poll_schedule.claim('seasons'):
+        poll_schedule.record('seasons', await jikan.sync_seasons())
+        refreshed.append('seasons')
+    feeds = [(feed_name('ranking', genre), poll_feed('ranking', genre), fetch_ranking, (genre,)) for genre in [None] + GENRE_LIST]
+    feeds += [
+        (feed_name('new_anime'), 'new_anime', fetch_new_anime_today, ()),
+        (feed_name('new_waifu'), 'new_waifu', fetch_new_waifu_today, ()),
+        (feed_name('airing'), 'airing', fetch_airing_today, ()),
+    ]
+    for name, poll, producer, args in feeds:
+        if not poll_schedule.claim(poll):
+            continue
+        shared_store.beat('worker')
+        data = await producer(*args)
+        if data is not None:
+            poll_schedule.record(poll, shared_store.set_feed(name, data))
+            refreshed.append(poll)
+    shared_store.purge_expired()
+    if refreshed:
+        print(f"Worker: đã cập nhật {', '.join(refreshed)} trong {time.time() - started:.1f}s")
+
+async def run_worker():
+    phase_started = mark_phase("imports", STARTUP_STARTED)
+    shared_store.busy_timeout = SHARED_DB_WORKER_BUSY_TIMEOUT
+    shared_store.get_conn()
+    mark_phase("database", phase_started)
+    try:
+        while True:
+            shared_store.beat('worker')
+            try:
+                await refresh_feeds()
+            except Exception as e:
+                print(f"Lỗi worker: {e}")
+            await asyncio.sleep(WORKER_TICK)
+    finally:
+        await anilist.close()
+        await jikan.close()
+        await waifu_api.close()
@@ -0,0 +1,1161 @@
+# Gateway Discord: bot, loop thông báo, lệnh, embed và web API. Chỉ process chạy bot mới import module này.
+from core import (anilist, cache, CACHE_TTL, catalog, Character, character_keys, CHECK_INTERVAL, CLUSTER_ID,
+    describe_movement, feed_name, fetch_airing_today, fetch_new_anime_today, fetch_new_waifu_today, fetch_ranking,
+    filter_unannounced, GENRE_LIST, init_db, load_feed, LOW_MEMORY, mark_announced, mark_phase, Media, page_items,
+    parse_media, poll_feed, poll_schedule, ranking_history, release_keys, remove_subscription, save_subscription,
+    SHARD_COUNT, SHARD_IDS, SHARDED, shared_store, STARTUP_STARTED, startup_timeline, waifu_api)
+
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+import os
+import datetime
+import asyncio
+import sqlite3
+from cachetools import LRUCache
+import random
+import json
+import time
+import math
+import hashlib
+from operator import attrgetter
+
+TOKEN = os.getenv('DISCORD_TOKEN')
+CHANNEL_ID = os.getenv('CHANNEL_ID')
+PREFIX = os.getenv('PREFIX', 'v!')
+
+if not TOKEN or not CHANNEL_ID:
+    raise ValueError("Thiếu DISCORD_TOKEN hoặc CHANNEL_ID trong file .env")
+
+# Cấu hình
+DAILY_CHECK_HOUR = 8
+WAIFU_PIC_INTERVAL = 10  # phút
+SHARD_HEALTH_INTERVAL = 30  # giây
+SHARD_STALE_AFTER = 90  # giây
+WEB_ENABLED = os.getenv('WEB_ENABLED', 'true').lower() in ('1', 'true')
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.getenv('PORT', '8000'))
+WEB_MAX_AGE = 60  # giây, Cache-Control cho các endpoint JSON
+SYNC_SLASH_COMMANDS = os.getenv('SYNC_SLASH_COMMANDS', 'true').lower() in ('1', 'true')
+EMBED_CACHE_SIZE = int(os.getenv('EMBED_CACHE_SIZE', '100' if LOW_MEMORY else '500'))  # Số embed media/nhân vật dựng sẵn giữ trong bộ nhớ
+MAX_EMBEDS_PER_MESSAGE = 10  # Giới hạn của Discord
+MAX_EMBED_CHARS_PER_MESSAGE = 6000  # Tổng ký tự mọi embed trong một tin nhắn
+# Cache nạp sẵn nhận lại đủ CACHE_TTL trong bộ nhớ: chỉ nạp mục còn hạn ít nhất chừng này để không giữ dữ liệu cũ quá lâu
+WARM_UP_MIN_TTL = CACHE_TTL * 3 // 4
+
+# Phản hồi vui nhộn
+RESPONSES = ["😍", "💖", "🔥"]
+
+# Khởi tạo bot
+if LOW_MEMORY:
+    # Lệnh chỉ cần tin nhắn (prefix), server và kênh; không đọc lịch sử tin nhắn hay danh sách thành viên
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.message_content = True
+    bot_options = {
+        "max_messages": None,
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+    }
+else:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    bot_options = {}
+if SHARDED:
+    bot = commands.AutoShardedBot(
+        command_prefix=PREFIX,
+        intents=intents,
+        shard_count=SHARD_COUNT or None,
+        shard_ids=SHARD_IDS,
+        **bot_options
+    )
+else:
+    bot = commands.Bot(command_prefix=PREFIX, intents=intents, **bot_options)
+
+# Embed dựng sẵn: (loại, id) -> (phiên bản dữ liệu, state của Embed)
+embed_cache = LRUCache(maxsize=EMBED_CACHE_SIZE)
+
+gateway_started = STARTUP_STARTED
+
+anime_notification_channels = set()
+waifu_notification_channels = set()
+airing_notification_channels = {int(CHANNEL_ID)}
+waifu_pic_channels = set()  # Danh sách kênh nhận ảnh waifu tự động
+ranking_notification_channels = {}  # {channel_id: genre}
+ranking_snapshots = {}  # {genre: bảng xếp hạng đã gửi gần nhất}, nạp sẵn từ bảng rankings
+subscription_sets = {
+    "anime": anime_notification_channels,
+    "waifu": waifu_notification_channels,
+    "airing": airing_notification_channels,
+    "waifu_pic": waifu_pic_channels,
+}
+
+# Kênh đã bị xóa: bỏ đăng ký để các set thông báo không phình theo kênh chết
+def drop_subscription(kind, channel_id):
+    if kind == "ranking":
+        ranking_notification_channels.pop(channel_id, None)
+    else:
+        subscription_sets[kind].discard(channel_id)
+    remove_subscription(kind, channel_id)
+
+# Nạp trạng thái đã lưu (chạy trong thread, song song với lúc kết nối gateway)
+def load_startup_state():
+    state = {"cache_rows": shared_store.load_cache_rows(cache.maxsize, WARM_UP_MIN_TTL)}
+    conn = sqlite3.connect('waifu.db')
+    try:
+        state["subscriptions"] = conn.execute('SELECT kind, channel_id, genre FROM subscriptions').fetchall()
+        state["rankings"] = {genre: json.loads(data) for genre, data in conn.execute('SELECT genre, data FROM rankings')}
+    finally:
+        conn.close()
+    return state
+
+async def warm_up():
+    started = time.perf_counter()
+    try:
+        state = await asyncio.to_thread(load_startup_state)
+    except Exception as e:
+        print(f"Lỗi warm_up: {e}")
+        return
+    for key, value in state["cache_rows"]:
+        cache[key] = value
+    for kind, channel_id, genre in state["subscriptions"]:
+        if kind == "ranking":
+            ranking_notification_channels[channel_id] = genre
+        elif kind in subscription_sets:
+            subscription_sets[kind].add(channel_id)
+    ranking_snapshots.update(state["rankings"])
+    print(f"[startup] Đã nạp {len(state['cache_rows'])} cache, {len(state['subscriptions'])} đăng ký, {len(state['rankings'])} bảng xếp hạng")
+    mark_phase("preload", started)
+
+startup_warmup = None  # Task warm_up, on_ready chờ nó xong mới chạy các loop
+
+# Gộp embed vào ít tin nhắn nhất, chỉ tách khi vượt số embed hoặc tổng ký tự cho phép
+def pack_embeds(embeds):
+    batches = []
+    batch_chars = 0
+    for embed in embeds:
+        size = len(embed)
+        if not batches or len(batches[-1]) >= MAX_EMBEDS_PER_MESSAGE or batch_chars + size > MAX_EMBED_CHARS_PER_MESSAGE:
+            batches.append([])
+            batch_chars = 0
+        batches[-1].append(embed)
+        batch_chars += size
+    return batches
+
+# Gửi cùng một nội dung tới nhiều kênh; kênh lỗi (bị xóa, mất quyền...) chỉ bị bỏ qua, không dừng cả lượt gửi.
+# Kênh trả về 404 thì bỏ luôn đăng ký `kind`.
+async def broadcast(channel_ids, content, embeds, task_name, kind):
+    batches = pack_embeds(embeds)
+    for channel_id in list(channel_ids):
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            continue
+        for i, batch in enumerate(batches):
+            try:
+                await channel.send(content if i == 0 else None, embeds=batch)
+            except discord.NotFound as e:
+                print(f"Lỗi {task_name} (kênh {channel_id}): {e}, bỏ đăng ký {kind}")
+                drop_subscription(kind, channel_id)
+                break
+            except discord.HTTPException as e:
+                print(f"Lỗi {task_name} (kênh {channel_id}): {e}")
+                break
+            await asyncio.sleep(0.5)
+
+# Task: Gửi ảnh waifu tự động mỗi 10 phút
+@tasks.loop(minutes=WAIFU_PIC_INTERVAL)
+async def send_waifu_pic():
+    if not waifu_pic_channels:
+        return
+    try:
+        image = await waifu_api.get_random_waifu(nsfw=False)
+        if not image:
+            print("Không lấy được ảnh waifu tự động")
+            return
+        
+        embed = discord.Embed(color=0xff9ff3)
+        embed.set_image(url=image.url)
+        embed.set_footer(text=f"Nguồn: Veloria Sever")
+        
+        await broadcast(waifu_pic_channels, "💖 **WAIFU CỦA PHÚT NÀY** 💖", [embed], "send_waifu_pic", "waifu_pic")
+    except Exception as e:
+        print(f"Lỗi send_waifu_pic: {e}")
+
+# Loop gửi thông báo chạy theo nhịp quét hiện tại của feed nguồn
+def follow_poll_schedule(loop, *feeds):
+    interval = min(poll_schedule.interval(feed) for feed in feeds)
+    if interval != loop.seconds:
+        loop.change_interval(seconds=interval)
+
+# Task: Kiểm tra và gửi bảng xếp hạng anime khi có thay đổi
+@tasks.loop(seconds=CHECK_INTERVAL)
+async def check_ranking_update():
+    if not ranking_notification_channels:
+        return
+    try:
+        channels_by_genre = {}
+        for channel_id, genre in ranking_notification_channels.items():
+            channels_by_genre.setdefault(genre, []).append(channel_id)
+        follow_poll_schedule(check_ranking_update, *(poll_feed('ranking', genre) for genre in channels_by_genre))
+        for genre, channel_ids in channels_by_genre.items():
+            # Lấy bảng xếp hạng mới
+            new_ranking = await load_feed(feed_name('ranking', genre), fetch_ranking, genre, poll=poll_feed('ranking', genre))
+            if not new_ranking:
+                continue
+            
+            # So sánh với bảng xếp hạng cũ (đã nạp sẵn từ database)
+            ranking_key = genre or 'default'
+            old_ranking = ranking_snapshots.get(ranking_key, [])
+            if old_ranking == new_ranking:
+                continue
+            # Lưu bảng xếp hạng mới vào database
+            ranking_snapshots[ranking_key] = new_ranking
+            conn = sqlite3.connect('waifu.db')
+            conn.execute('DELETE FROM rankings WHERE genre = ?', (ranking_key,))
+            conn.execute('INSERT INTO rankings (genre, data) VALUES (?, ?)', (ranking_key, json.dumps(new_ranking)))
+            conn.commit()
+            conn.close()
+            
+            # Gửi bảng xếp hạng mới kèm biến động thứ hạng
+            embed = discord.Embed(
+                title=f"📊 Bảng Xếp Hạng Anime Mới {'('+genre+')' if genre else ''}",
+                color=0xff69b4
+            )
+            movements = describe_movement(old_ranking, new_ranking)
+            for i, ((media_id, title, score), movement) in enumerate(zip(new_ranking, movements), 1):
+                embed.add_field(
+                    name=f"{i}. {title}",
+                    value=f"⭐ {score if score is not None else 'N/A'}/100 | {movement}",
+                    inline=False
+                )
+            embed.set_footer(text="Nguồn: AniList")
+            await broadcast(channel_ids, "📈 **BẢNG XẾP HẠNG ANIME ĐÃ CẬP NHẬT** 📈", [embed], "check_ranking_update", "ranking")
+    except Exception as e:
+        print(f"Lỗi check_ranking_update: {e}")
+
+# Các task khác (giữ nguyên)
+@tasks.loop(seconds=CHECK_INTERVAL)
+async def check_new_anime():
+    if not anime_notification_channels:
+        return
+    try:
+        today = datetime.datetime.now()
+        new_anime = await load_feed(feed_name('new_anime'), fetch_new_anime_today, poll='new_anime')
+        follow_poll_schedule(check_new_anime, 'new_anime')
+        new_anime = filter_unannounced('anime', new_anime or [], release_keys)[:3]
+        if new_anime:
+            embeds = []
+            for anime in new_anime:
+                embed = discord.Embed(
+                    title=anime['title'],
+                    description=anime['description'],
+                    color=0x00ff00,
+                    url=anime['url']
+                )
+                if anime['cover']:
+                    embed.set_image(url=anime['cover'])
+                embed.set_footer(text=f"Nguồn: {anime['source']}")
+                embeds.append(embed)
+            await broadcast(anime_notification_channels, "🎉 **ANIME RA MẮT HÔM NAY** 🎉", embeds, "check_new_anime", "anime")
+            mark_announced('anime', new_anime, release_keys)
+        else:
+            print(f"Không có anime mới ngày {today.day}/{today.month}/{today.year}")
+    except Exception as e:
+        print(f"Lỗi check_new_anime: {e}")
+
+@tasks.loop(seconds=CHECK_INTERVAL)
+async def check_new_waifu():
+    if not waifu_notification_channels:
+        return
+    try:
+        today = datetime.datetime.now()
+        new_waifu = await load_feed(feed_name('new_waifu'), fetch_new_waifu_today, poll='new_waifu')
+        follow_poll_schedule(check_new_waifu, 'new_waifu')
+        new_waifu = filter_unannounced('waifu', new_waifu or [], character_keys)[:3]
+        if not new_waifu:
+            print(f"Không có waifu mới ngày {today.day}/{today.month}/{today.year}")
+            return
+        embeds = [create_character_embed(character) for character in new_waifu]
+        await broadcast(waifu_notification_channels, "💖 **WAIFU MỚI HÔM NAY** 💖", embeds, "check_new_waifu", "waifu")
+        mark_announced('waifu', new_waifu, character_keys)
+    except Exception as e:
+        print(f"Lỗi check_new_waifu: {e}")
+
+@tasks.loop(hours=24)
+async def check_airing_today():
+    if not airing_notification_channels:
+        return
+    now = datetime.datetime.now()
+    if now.hour != DAILY_CHECK_HOUR:
+        return
+    try:
+        schedules = await load_feed(feed_name('airing'), fetch_airing_today, poll='airing')
+        if not schedules:
+            return
+        embeds = []
+        for schedule in schedules[:3]:
+            airing_time = datetime.datetime.fromtimestamp(schedule.airing_at).strftime('%H:%M')
+            embed = create_embed(schedule.media, 'anime')
+            embed.add_field(name="Lịch chiếu", value=f"Tập {schedule.episode} lúc {airing_time}", inline=False)
+            embeds.append(embed)
+        await broadcast(airing_notification_channels, "📺 **ANIME CHIẾU HÔM NAY** 📺", embeds, "check_airing_today", "airing")
+    except Exception as e:
+        print(f"Lỗi check_airing_today: {e}")
+
+# Task: Ghi tình trạng từng shard vào store dùng chung
+@tasks.loop(seconds=SHARD_HEALTH_INTERVAL)
+async def report_shard_health():
+    try:
+        if SHARDED:
+            for shard_id, shard in bot.shards.items():
+                guild_count = sum(1 for guild in bot.guilds if guild.shard_id == shard_id)
+                shared_store.report_shard(shard_id, shard.latency, guild_count, shard.is_closed())
+        else:
+            shared_store.report_shard(bot.shard_id or 0, bot.latency, len(bot.guilds), bot.is_closed())
+        shared_store.purge_expired()
+    except Exception as e:
+        print(f"Lỗi report_shard_health: {e}")
+
+# Commands
+@bot.command()
+async def anime(ctx, *, query):
+    """Tìm thông tin anime"""
+    await search_media(ctx, 'anime', query)
+
+@bot.command()
+async def manga(ctx, *, query):
+    """Tìm thông tin manga"""
+    await search_media(ctx, 'manga', query)
+
+@bot.command()
+async def character(ctx, *, query):
+    """Tìm thông tin nhân vật"""
+    try:
+        async with ctx.typing():
+            character = await lookup_character(query)
+            if not character:
+                return await ctx.send("Không tìm thấy nhân vật!")
+            embed = create_character_embed(character)
+            await ctx.send(embed=embed)
+    except Exception as e:
+        print(f"Lỗi character command: {e}")
+        await ctx.send("Đã xảy ra lỗi khi tìm nhân vật!")
+
+@bot.command()
+async def top(ctx, genre=None):
+    """Top 10 anime (có thể chọn thể loại)"""
+    try:
+        genre_name = genre
+        if genre:
+            genre = genre.lower()
+            if genre not in GENRE_LIST:
+                return await ctx.send(f"Thể loại '{genre}' không hợp lệ! Các thể loại: {', '.join(GENRE_LIST)}")
+        async with ctx.typing():
+            media_list = await anilist.get_trending('anime', limit=10, genre=genre)
+            if not media_list:
+                return await ctx.send("Không tìm thấy dữ liệu!")
+            embed = discord.Embed(
+                title=f"Top 10 Anime {'('+genre_name+')' if genre_name else ''}",
+                color=0xff69b4
+            )
+            for i, anime in enumerate(media_list[:10], 1):
+                embed.add_field(
+                    name=f"{i}. {anime.title}",
+                    value=f"⭐ {anime.score if anime.score is not None else 'N/A'}/100 | 🗓️ {anime.start_date[0] if anime.start_date else 'N/A'}",
+                    inline=False
+                )
+            embed.set_footer(text="Nguồn: AniList")
+            await ctx.send(embed=embed)
+    except Exception as e:
+        print(f"Lỗi top command: {e}")
+        await ctx.send("Đã xảy ra lỗi!")
+
+@bot.command()
+async def topyear(ctx):
+    """Top anime được yêu thích trong năm"""
+    try:
+        async with ctx.typing():
+            current_year = datetime.datetime.now().year
+            gql_query = """
+            query ($year: Int, $perPage: Int) {
+                Page(perPage: $perPage) {
+                    media(type: ANIME, sort: POPULARITY_DESC, seasonYear: $year) {
+                        id
+                        type
+                        title { romaji english }
+                        averageScore
+                        startDate { year }
+                    }
+                }
+            }
+            """
+            variables = {"year": current_year, "perPage": 10}
+            media_list = await anilist.query(gql_query, variables, page_items('media', parse_media))
+            if not media_list:
+                return await ctx.send("Không tìm thấy dữ liệu!")
+            embed = discord.Embed(title=f"Top 10 Anime Năm {current_year}", color=0x1e90ff)
+            for i, anime in enumerate(media_list[:10], 1):
+                embed.add_field(
+                    name=f"{i}. {anime.title}",
+                    value=f"⭐ {anime.score if anime.score is not None else 'N/A'}/100",
+                    inline=False
+                )
+            embed.set_footer(text="Nguồn: AniList")
+            await ctx.send(embed=embed)
+    except Exception as e:
+        print(f"Lỗi topyear command: {e}")
+        await ctx.send("Đã xảy ra lỗi!")
+
+@bot.command()
+async def topwaifu(ctx):
+    """Top 10 waifu được yêu thích"""
+    try:
+        async with ctx.typing():
+            female_characters = await anilist.get_top_female_characters(limit=10)
+            if female_characters is None:
+                return await ctx.send("Không tìm thấy dữ liệu!")
+            embed = discord.Embed(title="Top 10 Waifu Được Yêu Thích", color=discord.Color.pink())
+            count = 0
+            for character in female_characters:
+                count += 1
+                embed.add_field(
+                    name=f"{count}. {character.name}",
+                    value=f"📜 {(character.description or 'N/A')[:50]}...",
+                    inline=False
+                )
+            if count == 0:
+                await ctx.send("Không tìm thấy nhân vật nữ nào!")
+            else:
+                embed.set_footer(text="Nguồn: AniList")
+                await ctx.send(embed=embed)
+    except Exception as e:
+        print(f"Lỗi topwaifu command: {e}")
+        await ctx.send("Đã xảy ra lỗi!")
+
+@bot.command()
+async def vote(ctx, *, waifu):
+    """Vote cho waifu yêu thích"""
+    try:
+        conn = sqlite3.connect('waifu.db')
+        conn.execute('INSERT INTO votes (user_id, waifu) VALUES (?, ?)', (str(ctx.author.id), waifu))
+        conn.commit()
+        conn.close()
+        await ctx.send(f"Đã vote cho **{waifu}**! Dùng `{PREFIX}topvote` để xem kết quả.")
+    except Exception as e:
+        print(f"Lỗi vote command: {e}")
+        await ctx.send("Đã xảy ra lỗi khi vote!")
+
+@bot.command()
+async def topvote(ctx):
+    """Xem top waifu được vote trong server"""
+    try:
+        conn = sqlite3.connect('waifu.db')
+        cursor = conn.execute('SELECT waifu, COUNT(*) as count FROM votes GROUP BY waifu ORDER BY count DESC LIMIT 5')
+        embed = discord.Embed(title="Top 5 Waifu (Server)", color=discord.Color.pink())
+        count = 0
+        for i, (waifu, vote_count) in enumerate(cursor, 1):
+            count += 1
+            embed.add_field(name=f"{i}. {waifu}", value=f"{vote_count} votes", inline=False)
+        conn.close()
+        if count == 0:
+            await ctx.send(f"Chưa có vote nào! Dùng `{PREFIX}vote <tên_waifu>` để bắt đầu.")
+        else:
+            embed.set_footer(text="Nguồn: Server")
+            await ctx.send(embed=embed)
+    except Exception as e:
+        print(f"Lỗi topvote command: {e}")
+        await ctx.send("Đã xảy ra lỗi khi xem top vote!")
+
+@bot.command()
+async def checknew(ctx):
+    """Kiểm tra anime ra mắt hôm nay"""
+    try:
+        async with ctx.typing():
+            today = datetime.datetime.now()
+            new_anime = await load_feed(feed_name('new_anime'), fetch_new_anime_today, poll='new_anime')
+            if not new_anime:
+                await ctx.send(f"Không có anime ra mắt hôm nay ({today.day}/{today.month}/{today.year})!")
+            else:
+                await ctx.send(embed=create_new_anime_embed(new_anime, today))
+    except Exception as e:
+        print(f"Lỗi checknew command: {e}")
+        await ctx.send("Đã xảy ra lỗi khi kiểm tra anime mới!")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def autoanime(ctx, channel: discord.TextChannel = None):
+    """Bật/tắt thông báo anime mới"""
+    if channel:
+        anime_notification_channels.add(channel.id)
+        save_subscription("anime", channel.id)
+        if not check_new_anime.is_running():
+            check_new_anime.start()
+        await ctx.send(f"✅ Đã bật thông báo anime mới tại {channel.mention}")
+    else:
+        if ctx.channel.id in anime_notification_channels:
+            anime_notification_channels.remove(ctx.channel.id)
+            remove_subscription("anime", ctx.channel.id)
+            await ctx.send("❌ Đã tắt thông báo anime mới")
+        else:
+            await ctx.send(f"⚠️ Vui lòng chỉ định channel (vd: `{PREFIX}autoanime #channel`)")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def autowaifu(ctx, channel: discord.TextChannel = None):
+    """Bật/tắt thông báo waifu mới"""
+    if channel:
+        waifu_notification_channels.add(channel.id)
+        save_subscription("waifu", channel.id)
+        if not check_new_waifu.is_running():
+            check_new_waifu.start()
+        await ctx.send(f"✅ Đã bật thông báo waifu mới tại {channel.mention}")
+    else:
+        if ctx.channel.id in waifu_notification_channels:
+            waifu_notification_channels.remove(ctx.channel.id)
+            remove_subscription("waifu", ctx.channel.id)
+            await ctx.send("❌ Đã tắt thông báo waifu mới")
+        else:
+            await ctx.send(f"⚠️ Vui lòng chỉ định channel (vd: `{PREFIX}autowaifu #channel`)")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def autoairing(ctx, channel: discord.TextChannel = None):
+    """Bật/tắt thông báo anime chiếu hôm nay"""
+    if channel:
+        airing_notification_channels.add(channel.id)
+        save_subscription("airing", channel.id)
+        if not check_airing_today.is_running():
+            check_airing_today.start()
+        await ctx.send(f"✅ Đã bật thông báo anime chiếu hôm nay tại {channel.mention}")
+    else:
+        if ctx.channel.id in airing_notification_channels:
+            airing_notification_channels.remove(ctx.channel.id)
+            remove_subscription("airing", ctx.channel.id)
+            await ctx.send("❌ Đã tắt thông báo anime chiếu hôm nay")
+        else:
+            await ctx.send(f"⚠️ Vui lòng chỉ định channel (vd: `{PREFIX}autoairing #channel`)")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def autowaifupic(ctx, channel: discord.TextChannel = None):
+    """Bật/tắt gửi ảnh waifu tự động mỗi 10 phút"""
+    if channel:
+        waifu_pic_channels.add(channel.id)
+        save_subscription("waifu_pic", channel.id)
+        if not send_waifu_pic.is_running():
+            send_waifu_pic.start()
+        await ctx.send(f"✅ Đã bật gửi ảnh waifu tự động tại {channel.mention}")
+    else:
+        if ctx.channel.id in waifu_pic_channels:
+            waifu_pic_channels.remove(ctx.channel.id)
+            remove_subscription("waifu_pic", ctx.channel.id)
+            await ctx.send("❌ Đã tắt gửi ảnh waifu tự động")
+        else:
+            await ctx.send(f"⚠️ Vui lòng chỉ định channel (vd: `{PREFIX}autowaifupic #channel`)")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def autoranking(ctx, channel: discord.TextChannel = None, genre: str = None):
+    """Bật/tắt thông báo bảng xếp hạng anime khi có thay đổi (có thể chọn thể loại)"""
+    if channel:
+        if genre:
+            genre = genre.lower()
+            if genre not in GENRE_LIST:
+                return await ctx.send(f"Thể loại '{genre}' không hợp lệ! Các thể loại: {', '.join(GENRE_LIST)}")
+        ranking_notification_channels[channel.id] = genre
+        save_subscription("ranking", channel.id, genre)
+        if not check_ranking_update.is_running():
+            check_ranking_update.start()
+        await ctx.send(f"✅ Đã bật thông báo bảng xếp hạng {'('+genre+')' if genre else ''} tại {channel.mention}")
+    else:
+        if ctx.channel.id in ranking_notification_channels:
+            del ranking_notification_channels[ctx.channel.id]
+            remove_subscription("ranking", ctx.channel.id)
+            await ctx.send("❌ Đã tắt thông báo bảng xếp hạng")
+        else:
+            await ctx.send(f"⚠️ Vui lòng chỉ định channel (vd: `{PREFIX}autoranking #channel [thể loại]`)")
+
+@bot.command(name='waifu')
+async def random_waifu(ctx, nsfw: str = "false"):
+    """Lấy ảnh waifu ngẫu nhiên"""
+    if nsfw.lower() not in ["eeeee", "false"]:
+        return await ctx.send("Vui lòng dùng `true` hoặc `false` cho tham số NSFW")
+    
+    try:
+        image = await waifu_api.get_random_waifu(nsfw.lower() == "eeeee")
+        if not image:
+            return await ctx.send("Không tìm thấy waifu nào 😢")
+        
+        embed = discord.Embed(color=0xff9ff3)
+        embed.set_image(url=image.url)
+        embed.set_footer(text=f"Nguồn: Veloria Sever")
+        
+        await ctx.send(embed=embed)
+    except Exception as e:
+        print(f"Lỗi waifu command: {e}")
+        await ctx.send(f"Lỗi: {str(e)}")
+
+@bot.command(name='topwaifus')
+async def top_waifus(ctx, limit: int = 10):
+    """Top waifu phổ biến nhất"""
+    if limit > 20:
+        return await ctx.send("Tối đa 20 waifu thôi nhé!")
+    
+    try:
+        # Hai nguồn độc lập nên gọi song song
+        female_characters, waifu_images = await asyncio.gather(
+            anilist.get_top_female_characters(limit=limit),
+            waifu_api.get_popular_waifus(limit=limit)
+        )
+        if female_characters is None:
+            return await ctx.send("Đang cập nhật dữ liệu...")
+        
+        if not female_characters:
+            return await ctx.send("Không tìm thấy waifu nào!")
+        
+        if not waifu_images:
+            return await ctx.send("Không lấy được ảnh từ Waifu.im!")
+        
+        await ctx.send(embed=create_top_waifus_embed(female_characters, waifu_images, limit))
+        
+    except Exception as e:
+        print(f"Lỗi topwaifus command: {e}")
+        await ctx.send(f"Lỗi: {str(e)}")
+
+@bot.command()
+async def rankhistory(ctx, genre: str = None, days: int = 7):
+    """Xem lịch sử bảng xếp hạng anime (có thể chọn thể loại và số ngày)"""
+    try:
+        if genre and genre.isdigit():
+            genre, days = None, int(genre)
+        if genre:
+            genre = genre.lower()
+            if genre not in GENRE_LIST:
+                return await ctx.send(f"Thể loại '{genre}' không hợp lệ! Các thể loại: {', '.join(GENRE_LIST)}")
+        days = max(1, min(days, 90))
+        until = int(time.time())
+        rows = ranking_history.summarize(genre, until - days * 86400, until)
+        if not rows:
+            return await ctx.send("Chưa có lịch sử bảng xếp hạng!")
+        embed = discord.Embed(
+            title=f"📜 Lịch Sử Bảng Xếp Hạng {days} Ngày {'('+genre+')' if genre else ''}",
+            color=0xff69b4
+        )
+        for media_id, title, best_rank, appearances, last_rank, first_score, last_score in rows:
+            score_change = f" | Điểm {last_score - first_score:+d}" if first_score is not None and last_score is not None else ""
+            embed.add_field(
+                name=title or f"Anime #{media_id}",
+                value=f"🏅 Cao nhất #{best_rank} | Gần nhất #{last_rank} | {appearances} lần lên bảng{score_change}",
+                inline=False
+            )
+        embed.set_footer(text="Nguồn: AniList")
+        await ctx.send(embed=embed)
+    except Exception as e:
+        print(f"Lỗi rankhistory command: {e}")
+        await ctx.send("Đã xảy ra lỗi khi xem lịch sử bảng xếp hạng!")
+
+@bot.command()
+async def shards(ctx):
+    """Xem tình trạng và độ trễ của từng shard"""
+    try:
+        rows = shared_store.get_shard_health()
+        if not rows:
+            return await ctx.send("Chưa có dữ liệu shard!")
+        now = time.time()
+        current_shard = ctx.guild.shard_id if ctx.guild else None
+        embed = discord.Embed(title="🩺 Tình Trạng Shard", color=0x1e90ff)
+        for shard_id, cluster_id, pid, latency, guilds, closed, updated in rows[:25]:
+            if closed:
+                status = "🔴 Mất kết nối"
+            elif now - updated > SHARD_STALE_AFTER:
+                status = "🟠 Không phản hồi"
+            else:
+                status = "🟢 Hoạt động"
+            latency_text = f"{latency * 1000:.0f}ms" if latency is not None and math.isfinite(latency) else "N/A"
+            marker = " (shard này)" if shard_id == current_shard else ""
+            embed.add_field(
+                name=f"Shard {shard_id}{marker}",
+                value=f"{status} | ⏱️ {latency_text} | 🏠 {guilds} server | Cluster {cluster_id} (pid {pid})",
+                inline=False
+            )
+        embed.set_footer(text=f"Cập nhật mỗi {SHARD_HEALTH_INTERVAL} giây")
+        await ctx.send(embed=embed)
+    except Exception as e:
+        print(f"Lỗi shards command: {e}")
+        await ctx.send("Đã xảy ra lỗi khi xem shard!")
+
+# Slash command: defer ngay, hiện kết quả có sẵn trong cache rồi sửa lại khi dữ liệu mới về
+async def respond_progressively(interaction, cached, fetch, render, empty_message):
+    await interaction.response.defer(thinking=True)
+    partial = await cached()
+    message = None
+    if partial:
+        message = await interaction.edit_original_response(embed=render(partial))
+    fresh = await fetch()
+    if not fresh:
+        if not partial:
+            message = await interaction.edit_original_response(content=empty_message)
+    elif fresh != partial:
+        message = await interaction.edit_original_response(embed=render(fresh))
+    await add_flourish(message)
+
+async def run_slash(interaction, name, *args):
+    try:
+        await respond_progressively(interaction, *args)
+    except Exception as e:
+        print(f"Lỗi /{name}: {e}")
+        if interaction.response.is_done():
+            await interaction.edit_original_response(content="Đã xảy ra lỗi!", embed=None)
+        else:
+            await interaction.response.send_message("Đã xảy ra lỗi!", ephemeral=True)
+
+async def cached_media(media_type, query):
+    kind = media_type.upper()
+    media_id = catalog.resolve(kind, query)
+    # Kết quả tạm nên chấp nhận cả chi tiết đã cũ trong catalog
+    return catalog.get_detail(kind, media_id, max_age=math.inf) if media_id else None
+
+@bot.tree.command(name="anime", description="Tìm thông tin anime")
+@app_commands.describe(query="Tên anime")
+async def anime_slash(interaction: discord.Interaction, query: str):
+    await run_slash(interaction, "anime", lambda: cached_media('anime', query), lambda: lookup_media('anime', query),
+                    lambda media: create_embed(media, 'anime'), "Không tìm thấy anime!")
+
+@bot.tree.command(name="manga", description="Tìm thông tin manga")
+@app_commands.describe(query="Tên manga")
+async def manga_slash(interaction: discord.Interaction, query: str):
+    await run_slash(interaction, "manga", lambda: cached_media('manga', query), lambda: lookup_media('manga', query),
+                    lambda media: create_embed(media, 'manga'), "Không tìm thấy manga!")
+
+@bot.tree.command(name="character", description="Tìm thông tin nhân vật")
+@app_commands.describe(query="Tên nhân vật")
+async def character_slash(interaction: discord.Interaction, query: str):
+    async def cached():
+        character_id = catalog.resolve("CHARACTER", query)
+        return catalog.get_detail("CHARACTER", character_id, max_age=math.inf) if character_id else None
+    await run_slash(interaction, "character", cached, lambda: lookup_character(query),
+                    create_character_embed, "Không tìm thấy nhân vật!")
+
+@bot.tree.command(name="topwaifus", description="Top waifu phổ biến nhất")
+@app_commands.describe(limit="Số waifu (tối đa 20)")
+async def top_waifus_slash(interaction: discord.Interaction, limit: app_commands.Range[int, 1, 20] = 10):
+    # Kết quả tạm lấy ảnh nhân vật từ AniList, bản đầy đủ thay bằng ảnh Waifu.im
+    async def cached():
+        characters = await anilist.get_top_female_characters(limit=limit, cached_only=True)
+        return (characters, None) if characters else None
+    async def fetch():
+        characters, images = await asyncio.gather(
+            anilist.get_top_female_characters(limit=limit),
+            waifu_api.get_popular_waifus(limit=limit)
+        )
+        return (characters, images) if characters else None
+    await run_slash(interaction, "topwaifus", cached, fetch,
+                    lambda result: create_top_waifus_embed(result[0], result[1] or [], limit), "Không tìm thấy waifu nào!")
+
+@bot.tree.command(name="checknew", description="Kiểm tra anime ra mắt hôm nay")
+async def checknew_slash(interaction: discord.Interaction):
+    today = datetime.datetime.now()
+    async def cached():
+        return shared_store.get_feed(feed_name('new_anime'), math.inf)
+    await run_slash(interaction, "checknew", cached,
+                    lambda: load_feed(feed_name('new_anime'), fetch_new_anime_today, poll='new_anime'),
+                    lambda new_anime: create_new_anime_embed(new_anime, today),
+                    f"Không có anime ra mắt hôm nay ({today.day}/{today.month}/{today.year})!")
+
+# Helper Functions
+# Tìm qua catalog cục bộ trước, chỉ gọi AniList theo id khi chi tiết thiếu hoặc đã cũ
+async def lookup_media(media_type, query):
+    kind = media_type.upper()
+    media_id = catalog.resolve(kind, query)
+    if media_id:
+        media = catalog.get_detail(kind, media_id)
+        if media:
+            return media
+        media = await anilist.get_media(media_type, media_id)
+    else:
+        media = await anilist.search_media(media_type, query)
+        if media:
+            catalog.add_alias(kind, media.id, query)
+    catalog.store_detail(kind, media)
+    return media
+
+async def lookup_character(query):
+    character_id = catalog.resolve("CHARACTER", query)
+    if character_id:
+        character = catalog.get_detail("CHARACTER", character_id)
+        if character:
+            return character
+        character = await anilist.get_character(character_id)
+    else:
+        character = await anilist.search_character(query)
+        if character:
+            catalog.add_alias("CHARACTER", character.id, query)
+    catalog.store_detail("CHARACTER", character)
+    return character
+
+async def search_media(ctx, media_type, query):
+    try:
+        async with ctx.typing():
+            media = await lookup_media(media_type, query)
+            if not media:
+                return await ctx.send(f"Không tìm thấy {media_type}!")
+            embed = create_embed(media, media_type)
+            await ctx.send(embed=embed)
+    except Exception as e:
+        print(f"Lỗi {media_type} command: {e}")
+        await ctx.send(f"Đã xảy ra lỗi khi tìm {media_type}!")
+
+def format_date(date):
+    if not date:
+        return "N/A"
+    year, month, day = date
+    return f"{year}-{month or '?'}-{day or '?'}"
+
+# Phiên bản dữ liệu của record: đổi khi bất kỳ trường nào thay đổi
+RECORD_GETTERS = {cls: attrgetter(*cls.__slots__) for cls in (Media, Character)}
+def record_version(record):
+    return hash(RECORD_GETTERS[type(record)](record))
+
+# Chụp các slot đã gán của Embed; copy lại nhanh hơn Embed.from_dict (không phải bắt KeyError cho từng key thiếu)
+def embed_state(embed):
+    return tuple((name, getattr(embed, name)) for name in discord.Embed.__slots__ if hasattr(embed, name))
+
+# Mỗi lần gửi tạo Embed mới từ state; list fields và từng field được tách để add_field/set_field_at không sửa bản trong cache
+# (set_footer, set_image... luôn gán dict mới nên không cần chép)
+def copy_embed(state):
+    embed = discord.Embed.__new__(discord.Embed)
+    for name, value in state:
+        setattr(embed, name, value)
+    if hasattr(embed, '_fields'):
+        embed._fields = [dict(field) for field in embed._fields]
+    return embed
+
+def cached_embed(kind, record, build):
+    if record.id is None:
+        return build()
+    key = (kind, record.id)
+    version = record_version(record)
+    entry = embed_cache.get(key)
+    if entry is None or entry[0] != version:
+        entry = (version, embed_state(build()))
+        embed_cache[key] = entry
+    return copy_embed(entry[1])
+
+def create_new_anime_embed(new_anime, today):
+    embed = discord.Embed(
+        title=f"Anime Ra Mắt Hôm Nay ({today.day}/{today.month}/{today.year})",
+        color=0x00ff00
+    )
+    for i, anime in enumerate(new_anime[:10], 1):
+        embed.add_field(
+            name=f"{i}. {anime['title']} ({anime['source']})",
+            value=f"[Xem chi tiết]({anime['url']})",
+            inline=False
+        )
+    embed.set_footer(text="Nguồn: AniList & Jikan")
+    return embed
+
+def create_top_waifus_embed(female_characters, waifu_images, limit):
+    embed = discord.Embed(
+        title=f"🏆 Top {limit} Waifu Phổ Biến Nhất",
+        color=0xfeca57
+    )
+    for idx, character in enumerate(female_characters, 1):
+        embed.add_field(
+            name=f"{idx}. {character.name}",
+            value=f"Anime: {character.anime or 'Không rõ'}",
+            inline=False
+        )
+    image = waifu_images[0].url if waifu_images else female_characters[0].image if female_characters else None
+    if image:
+        embed.set_thumbnail(url=image)
+    embed.set_footer(text="Nguồn: AniList & Veloria Sever")
+    return embed
+
+def create_embed(media, media_type):
+    return cached_embed(media_type, media, lambda: build_media_embed(media, media_type))
+
+def create_character_embed(character):
+    return cached_embed('character', character, lambda: build_character_embed(character))
+
+def build_media_embed(media, media_type):
+    embed = discord.Embed(
+        title=media.title,
+        description=media.description or 'Không có mô tả',
+        color=0x00ff00 if media_type == 'anime' else 0x0000ff,
+        url=media.url
+    )
+    if media.cover:
+        embed.set_image(url=media.cover)
+    count = media.episodes if media_type == 'anime' else media.chapters
+    fields = [
+        ("Rating", media.score if media.score is not None else 'N/A', True),
+        ("Status", media.status or 'N/A', True),
+        ("Start Date", format_date(media.start_date), True),
+        ("End Date", format_date(media.end_date), True),
+        ("Episodes" if media_type == 'anime' else "Chapters", str(count if count is not None else 'N/A'), True)
+    ]
+    for name, value, inline in fields:
+        embed.add_field(name=name, value=value, inline=inline)
+    embed.set_footer(text="Nguồn: AniList")
+    return embed
+
+def build_character_embed(character):
+    embed = discord.Embed(
+        title=character.name,
+        description=character.description or 'Không có mô tả',
+        color=discord.Color.pink(),
+        url=character.url
+    )
+    if character.image:
+        embed.set_image(url=character.image)
+    embed.set_footer(text="Nguồn: AniList")
+    return embed
+
+# Web API (chạy chung event loop và cache với bot)
+web = None  # aiohttp.web chỉ được import khi bật web API
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def json_response(request, payload, max_age=WEB_MAX_AGE):
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {'ETag': etag, 'Cache-Control': f'public, max-age={max_age}'}
+    if etag_matches(request, etag):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type='application/json', headers=headers)
+
+def summarize_media(media):
+    return {
+        "id": media.id,
+        "title": media.title,
+        "score": media.score,
+        "status": media.status,
+        "year": media.start_date[0] if media.start_date else None,
+        "url": media.url,
+        "cover": media.cover
+    }
+
+async def web_home(request):
+    return web.Response(text="Tớ chạy được rồi đó, hmph!")
+
+async def web_health(request):
+    ready = bot.is_ready() and not bot.is_closed()
+    shard_rows = shared_store.get_shard_health()
+    payload = {
+        "status": "ok" if ready else "starting",
+        "ready": ready,
+        "latency_ms": round(bot.latency * 1000) if math.isfinite(bot.latency) else None,
+        "guilds": len(bot.guilds),
+        "startup_ms": {name: round(duration * 1000) for name, duration in startup_timeline},
+        "shards": [
+            {"shard_id": row[0], "cluster_id": row[1], "latency_ms": round(row[3] * 1000) if row[3] is not None and math.isfinite(row[3]) else None,
+             "guilds": row[4], "closed": bool(row[5]), "age": round(time.time() - row[6])}
+            for row in shard_rows
+        ]
+    }
+    return web.json_response(payload, status=200 if ready else 503, headers={'Cache-Control': 'no-store'})
+
+async def web_search(request):
+    media_type = request.query.get('type', 'anime').lower()
+    query = request.query.get('q', '').strip()
+    if not query:
+        return web.json_response({"error": "Thiếu tham số q"}, status=400)
+    if media_type == 'character':
+        character = await lookup_character(query)
+        if not character:
+            return web.json_response({"error": "Không tìm thấy nhân vật"}, status=404)
+        return json_response(request, {
+            "id": character.id,
+            "name": character.name,
+            "url": character.url,
+            "image": character.image
+        })
+    if media_type not in ('anime', 'manga'):
+        return web.json_response({"error": "type phải là anime, manga hoặc character"}, status=400)
+    media = await lookup_media(media_type, query)
+    if not media:
+        return web.json_response({"error": f"Không tìm thấy {media_type}"}, status=404)
+    return json_response(request, summarize_media(media))
+
+async def web_trending(request):
+    genre = request.query.get('genre')
+    if genre:
+        genre = genre.lower()
+        if genre not in GENRE_LIST:
+            return web.json_response({"error": f"Thể loại '{genre}' không hợp lệ", "genres": GENRE_LIST}, status=400)
+    media_list = await anilist.get_trending('anime', limit=10, genre=genre)
+    if not media_list:
+        return web.json_response({"error": "Không tìm thấy dữ liệu"}, status=404)
+    return json_response(request, {
+        "genre": genre,
+        "media": [dict(summarize_media(media), rank=i) for i, media in enumerate(media_list[:10], 1)]
+    })
+
+async def web_top_waifus(request):
+    try:
+        limit = min(max(int(request.query.get('limit', '10')), 1), 20)
+    except ValueError:
+        return web.json_response({"error": "limit phải là số"}, status=400)
+    female_characters = await anilist.get_top_female_characters(limit=limit)
+    if female_characters is None:
+        return web.json_response({"error": "Không tìm thấy dữ liệu"}, status=404)
+    return json_response(request, {
+        "waifus": [
+            {
+                "rank": i,
+                "id": character.id,
+                "name": character.name,
+                "anime": character.anime,
+                "image": character.image
+            }
+            for i, character in enumerate(female_characters, 1)
+        ]
+    })
+
+async def web_ranking_history(request):
+    genre = request.query.get('genre')
+    if genre:
+        genre = genre.lower()
+        if genre not in GENRE_LIST:
+            return web.json_response({"error": f"Thể loại '{genre}' không hợp lệ", "genres": GENRE_LIST}, status=400)
+    try:
+        until = int(request.query.get('until', time.time()))
+        since = int(request.query.get('since', until - 7 * 86400))
+    except ValueError:
+        return web.json_response({"error": "since/until phải là unix timestamp"}, status=400)
+    return json_response(request, {"genre": genre, "since": since, "until": until,
+                                   "sweeps": ranking_history.get_range(genre, since, until)})
+
+async def web_votes(request):
+    conn = sqlite3.connect('waifu.db')
+    try:
+        cursor = conn.execute('SELECT waifu, COUNT(*) as count FROM votes GROUP BY waifu ORDER BY count DESC LIMIT 20')
+        leaderboard = [{"rank": i, "waifu": waifu, "votes": count} for i, (waifu, count) in enumerate(cursor, 1)]
+    finally:
+        conn.close()
+    return json_response(request, {"votes": leaderboard}, max_age=10)
+
+def create_web_app():
+    global web
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get('/', web_home)
+    app.router.add_get('/health', web_health)
+    app.router.add_get('/api/search', web_search)
+    app.router.add_get('/api/trending', web_trending)
+    app.router.add_get('/api/topwaifus', web_top_waifus)
+    app.router.add_get('/api/votes', web_votes)
+    app.router.add_get('/api/rankings/history', web_ranking_history)
+    return app
+
+async def start_web_server():
+    app = create_web_app()
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEB_HOST, WEB_PORT)
+    await site.start()
+    print(f"Web API đang chạy tại {WEB_HOST}:{WEB_PORT}")
+    return runner
+
+# Events
+@bot.event
+async def on_ready():
+    print(f'Bot {bot.user.name} đã sẵn sàng!')
+    if not any(name == "gateway" for name, _ in startup_timeline):
+        mark_phase("gateway", gateway_started)
+    if startup_warmup:
+        await startup_warmup
+    if anime_notification_channels:
+        if not check_new_anime.is_running():
+            check_new_anime.start()
+    if waifu_notification_channels:
+        if not check_new_waifu.is_running():
+            check_new_waifu.start()
+    if airing_notification_channels:
+        if not check_airing_today.is_running():
+            check_airing_today.start()
+    if waifu_pic_channels:
+        if not send_waifu_pic.is_running():
+            send_waifu_pic.start()
+    if ranking_notification_channels:
+        if not check_ranking_update.is_running():
+            check_ranking_update.start()
+    if not report_shard_health.is_running():
+        report_shard_health.start()
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, commands.CommandNotFound):
+        await ctx.send(f"Lệnh không tồn tại! Dùng `{PREFIX}help` để xem danh sách lệnh")
+    elif isinstance(error, commands.MissingPermissions):
+        await ctx.send("Bạn không có quyền sử dụng lệnh này!")
+    else:
+        print(f"[ERROR] {type(error)}: {error}")
+        await ctx.send("Đã xảy ra lỗi!")
+
+# Context ghi lại tin nhắn trả lời gần nhất để thả reaction lên đó
+class ReplyContext(commands.Context):
+    reply_message = None
+
+    async def send(self, *args, **kwargs):
+        self.reply_message = await super().send(*args, **kwargs)
+        return self.reply_message
+
+@bot.event
+async def on_message(message):
+    if message.author.bot:
+        return
+    ctx = await bot.get_context(message, cls=ReplyContext)
+    await bot.invoke(ctx)
+
+# Thả reaction lên câu trả lời thay vì gửi thêm một tin nhắn
+async def add_flourish(message):
+    if message is None or random.random() >= 0.3:
+        return
+    try:
+        await message.add_reaction(random.choice(RESPONSES))
+    except discord.HTTPException as e:
+        print(f"Lỗi add_flourish: {e}")
+
+@bot.event
+async def on_command_completion(ctx):
+    await add_flourish(getattr(ctx, 'reply_message', None))
+
+# Đăng ký slash command với Discord (một lần, từ cluster 0)
+async def setup_hook():
+    if SYNC_SLASH_COMMANDS and CLUSTER_ID == 0:
+        try:
+            synced = await bot.tree.sync()
+            print(f"Đã đồng bộ {len(synced)} slash command")
+        except discord.HTTPException as e:
+            print(f"Lỗi đồng bộ slash command: {e}")
+
+bot.setup_hook = setup_hook
+
+# Main
+async def main():
+    global startup_warmup, gateway_started
+    phase_started = mark_phase("imports", STARTUP_STARTED)
+    # Mở database trước khi kết nối gateway để lỗi DB lộ ra ngay
+    init_db()
+    shared_store.get_conn()
+    phase_started = mark_phase("database", phase_started)
+    startup_warmup = asyncio.create_task(warm_up())
+    async with bot:
+        # Chỉ cluster 0 mở cổng web, tình trạng các cluster khác đọc qua store dùng chung
+        web_runner = await start_web_server() if WEB_ENABLED and CLUSTER_ID == 0 else None
+        if web_runner:
+            mark_phase("web", phase_started)
+        gateway_started = time.perf_counter()
+        try:
+            await bot.start(TOKEN)
+        finally:
+            if web_runner:
+                await web_runner.cleanup()
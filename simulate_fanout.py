@@ -0,0 +1,241 @@
+# Mô phỏng gửi thông báo tới rất nhiều kênh mà không cần kết nối Discord thật
+# Thay bot.get_channel/channel.send bằng lớp Discord giả (bucket rate limit theo route, 429, kênh bị xóa),
+# dùng đồng hồ ảo để asyncio.sleep và thời gian chờ rate limit không tốn thời gian thật.
+# Chạy: python simulate_fanout.py [--sizes 100,1000,10000,50000] [--loops send_waifu_pic,check_new_anime]
+import os
+import sys
+import time
+import asyncio
+import datetime
+import tempfile
+import tracemalloc
+
+WORK_DIR = tempfile.mkdtemp(prefix='fanout-sim-')
+os.environ.setdefault('DISCORD_TOKEN', 'simulate')
+os.environ.setdefault('CHANNEL_ID', '1')
+os.environ['SHARED_DB_PATH'] = os.path.join(WORK_DIR, 'shared.db')
+os.chdir(WORK_DIR)  # waifu.db được tạo theo đường dẫn tương đối
+
+import discord
+import core
+import gateway
+
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+DEFAULT_LOOPS = ["send_waifu_pic", "check_new_anime", "check_new_waifu", "check_airing_today", "check_ranking_update"]
+
+# Giới hạn của Discord: toàn cục 50 request/giây, tạo tin nhắn 5 request/5 giây cho mỗi kênh
+GLOBAL_LIMIT = (50, 1.0)
+CHANNEL_LIMIT = (5, 5.0)
+REQUEST_LATENCY = 0.08  # giây cho mỗi request thành công
+MISSING_RATIO = 0.01  # kênh không còn trong cache (get_channel trả về None)
+DELETED_RATIO = 0.01  # kênh còn trong cache nhưng đã bị xóa (send trả về 404)
+
+def get_arg_value(name, default):
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    async def sleep(self, delay, result=None):
+        self.now += max(delay, 0)
+        await asyncio.sleep(0)
+        return result
+
+# Thay module asyncio trong gateway: mọi thứ giữ nguyên trừ sleep chạy theo đồng hồ ảo
+class VirtualAsyncio:
+    def __init__(self, clock):
+        self.clock = clock
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    async def sleep(self, delay, result=None):
+        return await self.clock.sleep(delay, result)
+
+class Bucket:
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    # Trả về số giây phải chờ (retry_after của 429) hoặc 0 nếu được gửi ngay
+    def take(self, now):
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining > 0:
+            self.remaining -= 1
+            return 0
+        return self.reset_at - now
+
+class FakeResponse:
+    status = 404
+    reason = "Not Found"
+
+class FakeDiscord:
+    def __init__(self, clock):
+        self.clock = clock
+        self.global_bucket = Bucket(*GLOBAL_LIMIT)
+        self.channel_buckets = {}
+        self.channels = {}
+        self.messages = 0
+        self.embeds = 0
+        self.rate_limited = 0
+        self.not_found = 0
+        self.missing = 0
+
+    def populate(self, channel_ids):
+        self.channels = {}
+        for index, channel_id in enumerate(channel_ids):
+            if index % int(1 / MISSING_RATIO) == 1:
+                continue
+            self.channels[channel_id] = FakeChannel(self, channel_id, deleted=index % int(1 / DELETED_RATIO) == 2)
+
+    def get_channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            self.missing += 1
+        return channel
+
+    # Giống discord.py: gặp 429 thì chờ retry_after rồi gửi lại
+    async def request(self, channel_id):
+        bucket = self.channel_buckets.setdefault(channel_id, Bucket(*CHANNEL_LIMIT))
+        while True:
+            retry_after = max(self.global_bucket.take(self.clock.now), bucket.take(self.clock.now))
+            if retry_after <= 0:
+                break
+            self.rate_limited += 1
+            await self.clock.sleep(retry_after)
+        await self.clock.sleep(REQUEST_LATENCY)
+
+class FakeChannel:
+    def __init__(self, discord_layer, channel_id, deleted=False):
+        self.discord_layer = discord_layer
+        self.id = channel_id
+        self.deleted = deleted
+        self.mention = f"<#{channel_id}>"
+
+    async def send(self, content=None, *, embed=None, embeds=None, **kwargs):
+        await self.discord_layer.request(self.id)
+        if self.deleted:
+            self.discord_layer.not_found += 1
+            raise discord.NotFound(FakeResponse(), "Unknown Channel")
+        self.discord_layer.messages += 1
+        self.discord_layer.embeds += len(embeds or ([embed] if embed else []))
+
+def loop_interval(loop):
+    return (loop.hours or 0) * 3600 + (loop.minutes or 0) * 60 + (loop.seconds or 0)
+
+# Dữ liệu giả cho các feed mà worker thường tính sẵn
+def seed_upstream():
+    today = datetime.date.today()
+    media = [
+        gateway.Media(id=900000 + i, type="ANIME", title=f"Simulated Anime {i}", description="Mô phỏng " * 20,
+                      score=70 + i, status="RELEASING", start_date=(today.year, today.month, today.day),
+                      episodes=12, cover=f"https://example.com/{i}.jpg", url=f"https://anilist.co/anime/{900000 + i}")
+        for i in range(5)
+    ]
+    releases = [
+        {"title": anime.title, "description": anime.description, "url": anime.url, "cover": anime.cover,
+         "id": anime.id, "mal_id": None, "sources": ["AniList"], "source": "AniList"}
+        for anime in media
+    ]
+    characters = [
+        gateway.Character(id=800000 + i, name=f"Simulated Waifu {i}", description="Nhân vật mô phỏng",
+                          image=f"https://example.com/c{i}.jpg", url=f"https://anilist.co/character/{800000 + i}", female=True)
+        for i in range(5)
+    ]
+    airing = [core.AiringSlot(airing_at=int(time.time()), episode=i + 1, media=anime) for i, anime in enumerate(media)]
+    gateway.shared_store.set_feed(gateway.feed_name('new_anime'), releases)
+    gateway.shared_store.set_feed(gateway.feed_name('new_waifu'), characters)
+    gateway.shared_store.set_feed(gateway.feed_name('airing'), airing)
+    for genre in [None] + gateway.GENRE_LIST:
+        gateway.shared_store.set_feed(gateway.feed_name('ranking', genre),
+                                      [[anime.id, anime.title, anime.score] for anime in media] * 2)
+
+    async def get_random_waifu(nsfw=False):
+        return core.WaifuImage(image_id=1, url="https://example.com/waifu.jpg")
+    gateway.waifu_api.get_random_waifu = get_random_waifu
+
+def reset_subscriptions(channel_ids):
+    for channel_set in (gateway.anime_notification_channels, gateway.waifu_notification_channels,
+                        gateway.airing_notification_channels, gateway.waifu_pic_channels):
+        channel_set.clear()
+        channel_set.update(channel_ids)
+    gateway.ranking_notification_channels.clear()
+    for index, channel_id in enumerate(channel_ids):
+        gateway.ranking_notification_channels[channel_id] = gateway.GENRE_LIST[index % len(gateway.GENRE_LIST)]
+    gateway.ranking_snapshots.clear()
+    conn = gateway.sqlite3.connect('waifu.db')
+    conn.execute('DELETE FROM announced')
+    conn.commit()
+    conn.close()
+
+async def run_loop(loop_name, size, fake, clock):
+    channel_ids = list(range(10_000_000, 10_000_000 + size))
+    fake.populate(channel_ids)
+    reset_subscriptions(channel_ids)
+    fake.messages = fake.embeds = fake.rate_limited = fake.not_found = fake.missing = 0
+    fake.channel_buckets.clear()
+    fake.global_bucket = Bucket(*GLOBAL_LIMIT)
+    clock.now = 0.0
+    loop = getattr(gateway, loop_name)
+    tracemalloc.start()
+    wall_started = time.perf_counter()
+    await loop.coro()
+    wall = time.perf_counter() - wall_started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    interval = loop_interval(loop)
+    return {
+        "loop": loop_name,
+        "channels": size,
+        "messages": fake.messages,
+        "embeds": fake.embeds,
+        "rate_limited": fake.rate_limited,
+        "not_found": fake.not_found,
+        "missing": fake.missing,
+        "sweep": clock.now,
+        "rate": fake.messages / clock.now if clock.now else 0,
+        "peak_mb": peak / 1024 / 1024,
+        "wall": wall,
+        "interval": interval,
+        "overrun": clock.now > interval,
+    }
+
+def print_report(results):
+    header = (f"{'Loop':<22}{'Kênh':>8}{'Tin':>8}{'Embed':>8}{'429':>8}{'404':>6}{'Mất':>6}"
+              f"{'Quét (s)':>12}{'Tin/s':>8}{'Peak MB':>9}{'CPU (s)':>9}{'Chu kỳ':>9}  Trễ chu kỳ")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['loop']:<22}{r['channels']:>8}{r['messages']:>8}{r['embeds']:>8}{r['rate_limited']:>8}"
+              f"{r['not_found']:>6}{r['missing']:>6}{r['sweep']:>12.1f}{r['rate']:>8.1f}{r['peak_mb']:>9.1f}"
+              f"{r['wall']:>9.2f}{r['interval']:>9.0f}  {'⚠️ CÓ' if r['overrun'] else 'không'}")
+
+async def simulate(sizes, loop_names):
+    clock = VirtualClock()
+    fake = FakeDiscord(clock)
+    gateway.asyncio = VirtualAsyncio(clock)
+    gateway.bot.get_channel = fake.get_channel
+    gateway.DAILY_CHECK_HOUR = datetime.datetime.now().hour
+    # Chỉ giữ lại log lỗi của các loop để thấy sweep nào bị dừng giữa chừng
+    gateway.print = core.print = lambda *args, **kwargs: print(*args) if str(args[0]).startswith("Lỗi") else None
+    gateway.init_db()
+    seed_upstream()
+    results = []
+    for size in sizes:
+        for loop_name in loop_names:
+            results.append(await run_loop(loop_name, size, fake, clock))
+    print_report(results)
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in get_arg_value("--sizes", ",".join(map(str, DEFAULT_SIZES))).split(',')]
+    loop_names = get_arg_value("--loops", ",".join(DEFAULT_LOOPS)).split(',')
+    asyncio.run(simulate(sizes, loop_names))